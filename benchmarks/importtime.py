@@ -0,0 +1,134 @@
+"""
+    Measures how long importing refy takes with python -X importtime,
+    and which heavy dependencies each import statement loads.
+    Each statement is run in a new interpreter a few times and the fastest
+    run is kept. Results are saved to a .json file, and compared with a
+    previous results file if one is given.
+
+    Usage:
+        python benchmarks/importtime.py
+        python benchmarks/importtime.py --baseline importtime.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+root = str(Path(__file__).parent.parent)
+
+statements = (
+    "import refy",
+    "import refy.cli",
+    "from refy import Recomender",
+)
+
+# dependencies that should only be loaded by the stages that need them
+heavy = ("gensim", "sklearn", "scipy", "pandas", "pyinspect", "requests")
+
+
+def import_times(statement):
+    """
+        Runs a statement with python -X importtime
+
+        Returns:
+            times: dict of module: cumulative import time in seconds
+            top_level: list of str of modules imported by the statement itself
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    times, top_level = {}, []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative) / 1e6
+        if not module[1:].startswith(" "):
+            top_level.append(module.strip())
+    return times, top_level
+
+
+def run(statement, repeats=5):
+    """
+        Measures a statement and returns its total
+        import time and the heavy dependencies it loads
+    """
+    runs = []
+    for _ in range(repeats):
+        times, top_level = import_times(statement)
+        # top level modules' cumulative times add up to the total
+        runs.append((sum(times[module] for module in top_level), times))
+    total, times = min(runs, key=lambda run: run[0])
+
+    return dict(
+        statement=statement,
+        total_time=total,
+        heavy={module: times[module] for module in heavy if module in times},
+    )
+
+
+def compare(results, baseline):
+    """
+        Prints the ratio between the time of each statement
+        and the time of the same statement in a baseline
+    """
+    baseline = {r["statement"]: r for r in baseline["runs"]}
+    print("\nComparison with baseline (time / baseline time)")
+    for result in results["runs"]:
+        if result["statement"] not in baseline:
+            continue
+        before = baseline[result["statement"]]["total_time"]
+        print(
+            f"    {result['statement']:<30} {before:.3f}s -> "
+            f"{result['total_time']:.3f}s "
+            f"({result['total_time'] / before:.2f}x)"
+        )
+
+
+def main(output, baseline=None, repeats=5):
+    results = dict(
+        date=datetime.now().isoformat(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        runs=[],
+    )
+
+    for statement in statements:
+        result = run(statement, repeats=repeats)
+        results["runs"].append(result)
+
+        loaded = ", ".join(
+            f"{module} ({time:.3f}s)"
+            for module, time in result["heavy"].items()
+        )
+        print(
+            f"{statement:<30} {result['total_time']:.3f}s | "
+            f"loads: {loaded or 'none of ' + ', '.join(heavy)}"
+        )
+
+    with open(output, "w") as fl:
+        json.dump(results, fl, indent=2)
+    print(f"Saved results to: {output}")
+
+    if baseline is not None:
+        with open(baseline) as fl:
+            compare(results, json.load(fl))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default="importtime_results.json")
+    parser.add_argument("--baseline", help="Previous results .json file")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    main(args.output, baseline=args.baseline, repeats=args.repeats)
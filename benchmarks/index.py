@@ -0,0 +1,155 @@
+"""
+    Measures the recall@N of refy.index.VectorIndex against exact scoring of
+    the whole archive, and the time of a query with and without the index.
+    The archive is synthetic: each abstract is mostly written with the words
+    of one of a set of topics, as real abstracts belong to a field.
+    User libraries have papers from a few topics. Recall is reported for each
+    aggregation of the similarity to the user papers (see refy.similarity).
+
+    Usage:
+        python benchmarks/index.py --papers 10000 100000 --n-probe 4 8 16
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+import refy  # noqa: E402
+from refy.index import build_index  # noqa: E402
+from refy.infer import TfidfModel  # noqa: E402
+from refy.similarity import (  # noqa: E402
+    aggregations,
+    compute_similarity,
+    top_n,
+)
+from synthetic import Vocabulary  # noqa: E402
+
+
+class TopicCorpus:
+    def __init__(self, n_topics=200, topic_share=0.6, seed=0):
+        """
+            Random abstracts where a share of the words comes
+            from the topic of the abstract, the others from the
+            whole vocabulary
+        """
+        self.vocabulary = Vocabulary(seed=seed)
+        self.rng = self.vocabulary.rng
+        self.n_topics = n_topics
+        self.topic_share = topic_share
+
+        # each topic uses a few hundred words with Zipf frequencies
+        n_words = len(self.vocabulary.words)
+        self.topics = [
+            self.rng.choice(n_words, 300, replace=False)
+            for _ in range(n_topics)
+        ]
+        frequency = 1 / np.arange(1, 301)
+        self.p = frequency / frequency.sum()
+
+    def abstracts(self, topics, n_words=180):
+        """
+            Returns one random abstract for each topic in topics
+        """
+        n_topic = int(n_words * self.topic_share)
+        texts = []
+        for topic in topics:
+            words = np.concatenate(
+                [
+                    self.topics[topic][
+                        self.rng.choice(300, n_topic, p=self.p)
+                    ],
+                    self.rng.choice(
+                        len(self.vocabulary.words),
+                        n_words - n_topic,
+                        p=self.vocabulary.p,
+                    ),
+                ]
+            )
+            texts.append(" ".join(self.vocabulary.words[words]))
+        return texts
+
+
+def run(n_papers, n_probes, N=10, n_queries=20, library_size=50):
+    corpus = TopicCorpus()
+    topics = corpus.rng.integers(0, corpus.n_topics, n_papers)
+    abstracts = {
+        f"paper{n}": text
+        for n, text in enumerate(corpus.abstracts(topics))
+    }
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = perf_counter()
+        index = build_index(
+            abstracts, Path(folder) / "index", Path(folder) / "model.pkl"
+        )
+        build_time = perf_counter() - start
+        model = TfidfModel.load(Path(folder) / "model.pkl")
+
+    results = dict(n_papers=n_papers, build_time=build_time, runs=[])
+    print(
+        f"{n_papers} papers in {index.n_lists} lists | "
+        f"index built in {build_time:.1f}s"
+    )
+
+    # each library has papers from 3 topics
+    libraries = [
+        model.transform(
+            corpus.abstracts(
+                corpus.rng.choice(
+                    corpus.rng.integers(0, corpus.n_topics, 3), library_size
+                )
+            )
+        )
+        for _ in range(n_queries)
+    ]
+
+    start = perf_counter()
+    for user_vectors in libraries:
+        top_n(compute_similarity(index.vectors, user_vectors), N)
+    exact_time = (perf_counter() - start) / n_queries
+    print(f"    exact scoring:  {exact_time * 1000:.1f} ms per query")
+
+    for n_probe in n_probes:
+        start = perf_counter()
+        for user_vectors in libraries:
+            index.search(user_vectors, N=N, n_probe=n_probe)
+        query_time = (perf_counter() - start) / n_queries
+
+        recall = {
+            aggregation: np.mean(
+                [
+                    index.recall(
+                        user_vectors,
+                        N=N,
+                        n_probe=n_probe,
+                        aggregation=aggregation,
+                    )
+                    for user_vectors in libraries
+                ]
+            )
+            for aggregation in aggregations
+        }
+        results["runs"].append(
+            dict(n_probe=n_probe, recall=recall, query_time=query_time)
+        )
+        print(
+            f"    n_probe={n_probe:<4} {query_time * 1000:.1f} ms per query "
+            f"({exact_time / query_time:.1f}x faster) | recall@{N}: "
+            + ", ".join(f"{a}: {r:.2f}" for a, r in recall.items())
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, nargs="+", default=[10000])
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("-N", type=int, default=10)
+    args = parser.parse_args()
+
+    refy.set_logging("WARNING")
+    for n_papers in args.papers:
+        run(n_papers, args.n_probe, N=args.N)
@@ -0,0 +1,142 @@
+"""
+    Compares the vectorized preprints ingest (refy.download.clean_preprints)
+    and user library cleanup with the previous iterrows based implementation.
+
+    Usage:
+        python benchmarks/ingest.py --n 15000
+"""
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+from refy.download import clean_preprints  # noqa: E402
+
+
+def make_preprints(n, seed=0):
+    """
+        Creates a dataframe looking like downloaded arxiv
+        and biorxiv preprints, half from each source
+    """
+    rng = np.random.default_rng(seed)
+    n_arxiv = n // 2
+    words = np.array([f"word{i}" for i in range(2000)])
+
+    def text(n_words):
+        return " ".join(rng.choice(words, n_words))
+
+    arxiv = pd.DataFrame(
+        dict(
+            id=[f"http://arxiv.org/abs/2101.{i:05d}v1" for i in range(n_arxiv)],
+            title=[text(10) for _ in range(n_arxiv)],
+            published=["2021-01-10"] * n_arxiv,
+            authors=[[f"Author {i}", "Author B"] for i in range(n_arxiv)],
+            abstract=[text(150) for _ in range(n_arxiv)],
+            url="http://arxiv.org/abs/",
+            category="cs.LG",
+            source="arxiv",
+        )
+    )
+    biorxiv = pd.DataFrame(
+        dict(
+            doi=[f"10.1101/2021.01.{i:05d}" for i in range(n - n_arxiv)],
+            title=[text(10) for _ in range(n - n_arxiv)],
+            authors=[f"Author {i}; Author C" for i in range(n - n_arxiv)],
+            date=["2021-01-09"] * (n - n_arxiv),
+            category="neuroscience",
+            abstract=[text(150) for _ in range(n - n_arxiv)],
+            source="biorxiv",
+        )
+    )
+    biorxiv["id"] = biorxiv["doi"]
+    return pd.concat([arxiv, biorxiv])
+
+
+def clean_preprints_iterrows(papers):
+    """
+        The previous implementation, walking the rows with iterrows
+    """
+    papers = papers[
+        [
+            "id",
+            "doi",
+            "title",
+            "authors",
+            "date",
+            "category",
+            "abstract",
+            "source",
+            "url",
+        ]
+    ].copy()
+    papers["year"] = [
+        p.date.split("-")[0] if isinstance(p.date, str) else "2021"
+        for i, p in papers.iterrows()
+    ]
+    del papers["date"]
+
+    abstracts = {paper.id: paper.abstract for i, paper in papers.iterrows()}
+    del papers["abstract"]
+
+    papers = papers.loc[papers["id"].isin(abstracts.keys())]
+    papers = papers.drop_duplicates(subset="id")
+    return papers, abstracts
+
+
+def has_abstract_loop(data):
+    return [
+        True if (isinstance(a, str) and len(a) > 1) else False
+        for a in data["abstract"].values
+    ]
+
+
+def has_abstract_vectorized(data):
+    has_abs = data["abstract"].astype("string").str.len() > 1
+    return has_abs.fillna(False).astype(bool).values
+
+
+def timeit(func, *args, repeats=3):
+    """
+        Returns the best time (in seconds) over a few runs
+    """
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        func(*args)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def run(n):
+    papers = make_preprints(n)
+    library = papers[["title", "abstract"]].copy()
+    library.loc[library.index[::3], "abstract"] = np.nan
+
+    results = dict(
+        n_papers=n,
+        clean_preprints=dict(
+            iterrows=timeit(clean_preprints_iterrows, papers),
+            vectorized=timeit(clean_preprints, papers),
+        ),
+        user_abstracts=dict(
+            loop=timeit(has_abstract_loop, library),
+            vectorized=timeit(has_abstract_vectorized, library),
+        ),
+    )
+
+    print(f"Ingest of {n} preprints")
+    for stage in ("clean_preprints", "user_abstracts"):
+        old, new = results[stage].values()
+        print(
+            f"    {stage:<16} before: {old:.3f}s | after: {new:.3f}s | speedup: {old / new:.1f}x"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=15000)
+    run(parser.parse_args().n)
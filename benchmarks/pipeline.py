@@ -0,0 +1,198 @@
+"""
+    Runs refy.Recomender end to end on synthetic preprints and user
+    libraries (see synthetic.py), with downloads served from memory,
+    and reports wall time and peak memory of each stage:
+    fetch_preprints, load_user_input, fit, get_keywords, print and to_html.
+    Each run is repeated with each keywords backend (TextRank and TF-IDF),
+    so that the time of get_keywords can be compared between them.
+    Results are saved to a .json file, and compared with a previous
+    results file if one is given.
+
+    Stages are measured by refy.metrics.Metrics. Peak memory is measured with
+    tracemalloc, which slows down python code, use --no-memory for more
+    accurate times.
+
+    Usage:
+        python benchmarks/pipeline.py --preprints 1000 10000 100000 --user-papers 10 100 1000
+        python benchmarks/pipeline.py --preprints 10000 --baseline results.json
+        python benchmarks/pipeline.py --keywords-backend tfidf
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+sys.path.append(str(Path(__file__).parent.parent))
+import refy  # noqa: E402
+import refy.download  # noqa: E402
+import refy.keywords  # noqa: E402
+import refy.recomend  # noqa: E402
+import synthetic  # noqa: E402
+
+stages = (
+    "fetch_preprints",
+    "load_user_input",
+    "fit",
+    "get_keywords",
+    "print",
+    "to_html",
+)
+
+
+@contextlib.contextmanager
+def patched(obj, name, value):
+    original = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, original)
+
+
+def run(n_preprints, n_user_papers, memory=True, keywords_backend="textrank"):
+    """
+        Runs Recomender on synthetic data and returns metrics for each stage
+    """
+    arxiv, biorxiv = synthetic.make_preprints(n_preprints)
+    session = synthetic.FixtureSession(arxiv, biorxiv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        library = Path(folder) / "library.bib"
+        library.write_text(synthetic.make_library(n_user_papers))
+
+        with contextlib.ExitStack() as stack:
+            # serve downloads from memory
+            enter = stack.enter_context
+            enter(patched(refy.download, "Session", lambda *a, **k: session))
+            enter(patched(refy.download, "sleep", lambda seconds: None))
+            enter(contextlib.redirect_stdout(io.StringIO()))
+
+            start = perf_counter()
+            recomender = refy.recomend.Recomender(
+                library,
+                html_path=Path(folder) / "results.html",
+                show_html=False,
+                n_days=7,
+                use_cache=False,
+                keywords_backend=keywords_backend,
+                trace_memory=memory,
+            )
+            total = perf_counter() - start
+
+    metrics = recomender.metrics.stages
+    return dict(
+        n_preprints=len(recomender.store),
+        n_user_papers=len(recomender.user_papers),
+        keywords_backend=keywords_backend,
+        total_time=total,
+        stages={stage: metrics[stage] for stage in stages if stage in metrics},
+    )
+
+
+def compare(results, baseline):
+    """
+        Prints the ratio between the time of each stage
+        and the time of the same stage in a baseline
+    """
+
+    def run_key(run):
+        return (
+            run["n_preprints"],
+            run["n_user_papers"],
+            run.get("keywords_backend", "textrank"),
+        )
+
+    baseline = {run_key(r): r for r in baseline["runs"]}
+    print("\nComparison with baseline (time / baseline time)")
+    for result in results["runs"]:
+        key = run_key(result)
+        if key not in baseline:
+            continue
+        ratios = [
+            f"{stage}: {metrics['time'] / baseline[key]['stages'][stage]['time']:.2f}x"
+            for stage, metrics in result["stages"].items()
+            if stage in baseline[key]["stages"]
+        ]
+        print(
+            f"    {key[0]} preprints, {key[1]} user papers, {key[2]} | "
+            + " | ".join(ratios)
+        )
+
+
+def main(
+    preprints,
+    user_papers,
+    output,
+    baseline=None,
+    memory=True,
+    keywords_backends=refy.keywords.keywords_backends,
+):
+    refy.set_logging("WARNING")
+    results = dict(
+        date=datetime.now().isoformat(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        memory=memory,
+        runs=[],
+    )
+
+    for n_preprints in preprints:
+        for n_user_papers in user_papers:
+            for backend in keywords_backends:
+                result = run(
+                    n_preprints,
+                    n_user_papers,
+                    memory=memory,
+                    keywords_backend=backend,
+                )
+                results["runs"].append(result)
+
+                print(
+                    f"{result['n_preprints']} preprints, "
+                    f"{result['n_user_papers']} user papers, {backend} "
+                    f"keywords | total: {result['total_time']:.2f}s"
+                )
+                for stage, metrics in result["stages"].items():
+                    peak = metrics.get("peak_traced")
+                    peak = f" | peak memory: {peak / 1e6:.1f} MB" if peak else ""
+                    print(f"    {stage:<16} {metrics['time']:.3f}s{peak}")
+
+    with open(output, "w") as fl:
+        json.dump(results, fl, indent=2)
+    print(f"Saved results to: {output}")
+
+    if baseline is not None:
+        with open(baseline) as fl:
+            compare(results, json.load(fl))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preprints", type=int, nargs="+", default=[1000])
+    parser.add_argument("--user-papers", type=int, nargs="+", default=[10])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Previous results .json file")
+    parser.add_argument(
+        "--keywords-backend",
+        nargs="+",
+        default=list(refy.keywords.keywords_backends),
+        choices=refy.keywords.keywords_backends,
+    )
+    parser.add_argument("--no-memory", action="store_true")
+    args = parser.parse_args()
+
+    main(
+        args.preprints,
+        args.user_papers,
+        args.output,
+        baseline=args.baseline,
+        memory=not args.no_memory,
+        keywords_backends=args.keywords_backend,
+    )
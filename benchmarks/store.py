@@ -0,0 +1,92 @@
+"""
+    Compares the memory used by the preprints dataframe and abstracts
+    dict with the memory used by a refy.store.PaperStore holding the same
+    papers, reported per 10k papers.
+
+    Usage:
+        python benchmarks/store.py --n 15000
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from refy.download import clean_preprints  # noqa: E402
+from refy.store import PaperStore  # noqa: E402
+from ingest import make_preprints  # noqa: E402
+
+
+def deep_size(obj, seen=None):
+    """
+        Returns the size in bytes of a python object and of all
+        the lists, dicts and strings it contains, counting
+        each object once
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items()
+        )
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+def frame_size(papers):
+    """
+        Returns the memory used by a dataframe, including the
+        lists of authors and the strings inside them
+    """
+    seen = set()
+    size = papers.index.nbytes
+    for column in papers.columns:
+        values = papers[column]
+        if values.dtype == object:
+            size += values.values.nbytes + sum(
+                deep_size(v, seen) for v in values.values
+            )
+        else:
+            size += values.memory_usage(index=False, deep=True)
+    return size
+
+
+def run(n):
+    papers, abstracts = clean_preprints(make_preprints(n))
+    store = PaperStore(papers, abstracts)
+
+    abstracts_size = (
+        len(store.abstracts_buffer) + store.abstract_offsets.nbytes
+    )
+    results = dict(
+        n_papers=len(store),
+        metadata=dict(
+            before=frame_size(papers),
+            after=store.memory_usage() - abstracts_size,
+        ),
+        abstracts=dict(before=deep_size(abstracts), after=abstracts_size),
+    )
+    results["total"] = {
+        key: results["metadata"][key] + results["abstracts"][key]
+        for key in ("before", "after")
+    }
+
+    per_10k = 1e4 / len(store) / 1e6
+    print(f"Memory for {len(store)} preprints, in MB per 10k papers")
+    for part in ("metadata", "abstracts", "total"):
+        before, after = results[part]["before"], results[part]["after"]
+        print(
+            f"    {part:<10} before: {before * per_10k:.1f} | "
+            f"after: {after * per_10k:.1f} | ratio: {before / after:.1f}x"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=15000)
+    run(parser.parse_args().n)
@@ -0,0 +1,249 @@
+"""
+    Generates a synthetic corpus for benchmarks: arxiv Atom feeds,
+    biorxiv API JSON pages and .bib user libraries of any size, and a
+    session serving the feeds and pages as if they came from the APIs.
+
+    Usage:
+        python benchmarks/synthetic.py --preprints 10000 --user-papers 100 --output fixtures
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+from refy.settings import arxiv_categories, biorxiv_categories  # noqa: E402
+
+
+class Vocabulary:
+    def __init__(self, n_words=20000, seed=0):
+        """
+            Random words whose frequencies follow Zipf's law,
+            like words in real abstracts
+        """
+        self.rng = np.random.default_rng(seed)
+        letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+        self.words = np.array(
+            [
+                "".join(self.rng.choice(letters, self.rng.integers(3, 11)))
+                for _ in range(n_words)
+            ]
+        )
+        frequency = 1 / np.arange(1, n_words + 1)
+        self.p = frequency / frequency.sum()
+
+    def texts(self, n, n_words):
+        """
+            Returns n random texts with n_words words each
+        """
+        words = self.words[
+            self.rng.choice(len(self.words), size=(n, n_words), p=self.p)
+        ]
+        return [" ".join(text) for text in words]
+
+    def names(self, n):
+        """
+            Returns n random authors names
+        """
+        first, last = self.rng.choice(self.words[:5000], size=(2, n))
+        return [f"{f.title()} {l.title()}" for f, l in zip(first, last)]
+
+
+def make_preprints(n, n_days=7, seed=0, today=None):
+    """
+        Creates the records of n preprints published in the last n days,
+        half on arxiv and half on biorxiv. A few arxiv preprints are older
+        than n days, so that downloads stop as with the real API.
+
+        Returns:
+            arxiv: list of dict, most recent first
+            biorxiv: list of dict
+    """
+    vocabulary = Vocabulary(seed=seed)
+    today = today or datetime.today()
+    n_arxiv = n // 2 + 10
+    n_biorxiv = n - n // 2
+
+    def dates(n, max_days):
+        days = np.sort(vocabulary.rng.integers(0, max_days, n))
+        return [(today - timedelta(int(d))).strftime("%Y-%m-%d") for d in days]
+
+    arxiv = [
+        dict(
+            id=f"http://arxiv.org/abs/{2100 + i // 100000}.{i % 100000:05d}v1",
+            title=title,
+            published=date,
+            authors=vocabulary.names(int(vocabulary.rng.integers(1, 8))),
+            abstract=abstract,
+            category=str(vocabulary.rng.choice(arxiv_categories)),
+        )
+        for i, (title, date, abstract) in enumerate(
+            zip(
+                vocabulary.texts(n_arxiv, 10),
+                dates(n_arxiv - 10, n_days) + dates(10, 1),
+                vocabulary.texts(n_arxiv, 180),
+            )
+        )
+    ]
+    for paper in arxiv[-10:]:  # older than n_days
+        paper["published"] = (today - timedelta(n_days + 30)).strftime(
+            "%Y-%m-%d"
+        )
+
+    biorxiv = [
+        dict(
+            doi=f"10.1101/{today.year}.01.{i:06d}",
+            title=title,
+            authors="; ".join(
+                vocabulary.names(int(vocabulary.rng.integers(1, 8)))
+            ),
+            date=date,
+            category=str(vocabulary.rng.choice(biorxiv_categories)),
+            abstract=abstract,
+            version="1",
+            type="new results",
+            server="biorxiv",
+        )
+        for i, (title, date, abstract) in enumerate(
+            zip(
+                vocabulary.texts(n_biorxiv, 10),
+                dates(n_biorxiv, n_days),
+                vocabulary.texts(n_biorxiv, 180),
+            )
+        )
+    ]
+    return arxiv, biorxiv
+
+
+def arxiv_feed(papers):
+    """
+        Returns an arxiv API Atom feed with a set of preprints, as bytes
+    """
+    entries = [
+        "<entry>"
+        f"<id>{p['id']}</id>"
+        f"<published>{p['published']}T18:00:00Z</published>"
+        f"<title>{escape(p['title'])}</title>"
+        f"<summary>{escape(p['abstract'])}</summary>"
+        + "".join(
+            f"<author><name>{escape(a)}</name></author>" for a in p["authors"]
+        )
+        + f'<link href="{p["id"]}" rel="alternate" type="text/html"/>'
+        f'<arxiv:primary_category term="{p["category"]}"/>'
+        "</entry>"
+        for p in papers
+    ]
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom" '
+        'xmlns:arxiv="http://arxiv.org/schemas/atom">'
+        + "\n".join(entries)
+        + "</feed>"
+    ).encode("utf-8")
+
+
+def biorxiv_page(papers, cursor):
+    """
+        Returns a biorxiv API page with 100 preprints starting at cursor
+    """
+    return dict(
+        messages=[dict(status="ok", cursor=cursor, total=len(papers))],
+        collection=papers[cursor : cursor + 100],
+    )
+
+
+def make_library(n, seed=1):
+    """
+        Returns the content of a .bib file with n papers. One in ten
+        papers has no abstract, as in real libraries.
+    """
+    vocabulary = Vocabulary(seed=seed)
+    titles = vocabulary.texts(n, 10)
+    abstracts = vocabulary.texts(n, 180)
+    entries = []
+    for i, (title, abstract) in enumerate(zip(titles, abstracts)):
+        authors = " and ".join(
+            vocabulary.names(int(vocabulary.rng.integers(1, 6)))
+        )
+        abstract = f"  abstract = {{{abstract}}},\n" if i % 10 else ""
+        entries.append(
+            f"@article{{paper{i},\n"
+            f"  title = {{{title}}},\n"
+            f"  author = {{{authors}}},\n"
+            f"  journal = {{Journal of {title.split()[0].title()}}},\n"
+            f"  year = {{2020}},\n"
+            f"{abstract}"
+            f"  doi = {{10.1000/{i}}}\n"
+            "}\n"
+        )
+    return "\n".join(entries)
+
+
+class FixtureSession:
+    def __init__(self, arxiv, biorxiv, chunk_size=2 ** 16):
+        """
+            Replaces refy.web_utils.Session, serving synthetic
+            preprints as the arxiv and biorxiv APIs would.
+
+            Arguments:
+                arxiv, biorxiv: list of dict, see make_preprints
+                chunk_size: int. Size of the chunks of arxiv feeds
+        """
+        self.arxiv = arxiv
+        self.biorxiv = biorxiv
+        self.chunk_size = chunk_size
+
+        # render feeds in advance, with refy's page size
+        self.feeds = {
+            (start, 500): arxiv_feed(arxiv[start : start + 500])
+            for start in range(0, len(arxiv), 500)
+        }
+
+    def check_connection(self):
+        pass
+
+    def request(self, url, to_json=False):
+        cursor = int(url.rstrip("/").split("/")[-1])
+        page = biorxiv_page(self.biorxiv, cursor)
+        return page if to_json else json.dumps(page)
+
+    def stream(self, url, chunk_size=None):
+        start = int(re.search(r"start=(\d+)", url).group(1))
+        size = int(re.search(r"max_results=(\d+)", url).group(1))
+        feed = self.feeds.get((start, size))
+        if feed is None:
+            feed = arxiv_feed(self.arxiv[start : start + size])
+
+        chunk_size = chunk_size or self.chunk_size
+        for n in range(0, len(feed), chunk_size):
+            yield feed[n : n + chunk_size]
+
+
+def save_fixtures(folder, n_preprints, n_user_papers, n_days=7):
+    """
+        Saves an arxiv Atom feed (arxiv.xml), biorxiv API pages
+        (biorxiv_<cursor>.json) and a user library (library.bib) to a folder
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    arxiv, biorxiv = make_preprints(n_preprints, n_days=n_days)
+    (folder / "arxiv.xml").write_bytes(arxiv_feed(arxiv))
+    for cursor in range(0, max(len(biorxiv), 1), 100):
+        with open(folder / f"biorxiv_{cursor}.json", "w") as fl:
+            json.dump(biorxiv_page(biorxiv, cursor), fl)
+    (folder / "library.bib").write_text(make_library(n_user_papers))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preprints", type=int, default=10000)
+    parser.add_argument("--user-papers", type=int, default=100)
+    parser.add_argument("--n-days", type=int, default=7)
+    parser.add_argument("--output", default="fixtures")
+    args = parser.parse_args()
+    save_fixtures(args.output, args.preprints, args.user_papers, args.n_days)
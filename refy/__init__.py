@@ -1,10 +1,3 @@
-from pyinspect import install_traceback
-
-install_traceback(hide_locals=True)
-
-
-from refy.recomend import Recomender
-
 from loguru import logger
 import sys
 
@@ -15,3 +8,19 @@ def set_logging(level="INFO", path=None):
 
 
 set_logging()
+
+
+def __getattr__(name):
+    """
+        Recomender is only imported when first used, so that importing refy
+        (e.g. by the command line interface) doesn't import its dependencies
+    """
+    if name == "Recomender":
+        from pyinspect import install_traceback
+
+        install_traceback(hide_locals=True)
+
+        from refy.recomend import Recomender
+
+        return Recomender
+    raise AttributeError(f"module 'refy' has no attribute '{name}'")
@@ -2,6 +2,7 @@ from rich.table import Table
 from rich.console import Console
 from rich.columns import Columns
 from io import StringIO
+import pandas as pd
 from loguru import logger
 
 from myterial import pink, light_green
@@ -17,19 +18,86 @@ def get_authors(paper):
         Returns:
             authors: list of str of authors
     """
+    if isinstance(paper.authors, list):  # already normalized
+        return paper.authors
+
     if paper.source == "biorxiv":
         splitter = "; "
     elif paper.source == "arxiv":
-        if isinstance(paper.authors, list):
-            return paper.authors
-        else:
-            return [paper.authors["name"]]
+        return [paper.authors["name"]]
     else:
         splitter = ", "
 
     return paper.authors.split(splitter)
 
 
+def normalize_authors(papers):
+    """
+        Converts the authors of each paper to a list of names. Depending on
+        the source, authors can be stored as a '; ' or ', ' separated string,
+        a list of names, or a dict with the name of a single author.
+
+        Arguments:
+            papers: pd.DataFrame with papers metadata
+
+        Returns:
+            authors: pd.Series with a list of str for each paper
+    """
+    authors = papers.authors.reset_index(drop=True)
+    kind = authors.map(type)
+    biorxiv = (papers.source == "biorxiv").values
+
+    normalized = pd.Series([[]] * len(authors), dtype=object)
+    for mask, split in (
+        (kind == list, lambda names: names),
+        ((kind == str) & biorxiv, lambda names: names.str.split("; ")),
+        ((kind == str) & ~biorxiv, lambda names: names.str.split(", ")),
+        (kind == dict, lambda names: names.map(lambda a: [a["name"]])),
+    ):
+        # empty selections may not have a string dtype
+        if mask.any():
+            normalized[mask] = split(authors[mask])
+
+    normalized.index = papers.index
+    return normalized
+
+
+def authors_table(papers):
+    """
+        Creates a table with one row for each author of each paper,
+        with authors names stored as a categorical column.
+
+        Arguments:
+            papers: pd.DataFrame with papers metadata, with
+                authors normalized by normalize_authors
+
+        Returns:
+            table: pd.DataFrame with 'id', 'position' and 'author' columns
+    """
+    table = papers[["id", "authors"]].reset_index(drop=True)
+    table = table.explode("authors").dropna()
+    table.columns = ["id", "author"]
+    table["position"] = table.groupby(level=0).cumcount()
+    table["author"] = table["author"].astype("category")
+    return table.reset_index(drop=True)[["id", "position", "author"]]
+
+
+def top_authors(table, N=None):
+    """
+        Returns the authors that appear most often in a table of authors
+
+        Arguments:
+            table: pd.DataFrame created by authors_table
+            N: int. Optional number of authors to return
+
+        Returns:
+            authors: list of str of authors names sorted by frequency
+    """
+    counts = table.groupby("author", observed=True).size()
+    authors = list(counts.sort_values(ascending=False, kind="stable").index)
+    return authors[:N] if N is not None else authors
+
+
 class Authors:
     def __init__(self, authors):
         """
@@ -0,0 +1,157 @@
+from pathlib import Path
+from datetime import datetime
+from loguru import logger
+
+from myterial import orange, green
+
+from refy.download import fetch_preprints
+from refy.cache import PreprintsCache, LibraryCache, KeywordsCache
+from refy.input import load_user_input, loaders
+from refy.infer import fit_tfidf, TfidfModel
+from refy.similarity import compute_group_similarity, top_n
+from refy.keywords import (
+    get_papers_keywords,
+    combine_keywords,
+    get_tfidf_keywords,
+    check_keywords_backend,
+)
+from refy.results import Results
+from refy.utils import date_to_string
+
+
+def batch_recommend(
+    bib_folder,
+    output_folder,
+    N=10,
+    n_days=2,
+    aggregation="median",
+    top_k=5,
+    use_cache=True,
+    cache_path=None,
+    model_path=None,
+    keywords_backend="textrank",
+    n_workers=1,
+):
+    """
+        Recommends preprints to several users at once. Preprints are
+        downloaded and vectorized once for all users and the libraries of
+        all users are scored in the same matrix products, then the results
+        for each user are saved to a .html and a .csv file named after
+        the user's library file, so each user must have a single file.
+
+        Arguments:
+            bib_folder: str, Path. Folder with one library file per user
+                (.bib or any other format in refy.input.loaders)
+            output_folder: str, Path. Folder where results are saved
+            N: int. Number of papers to return for each user
+            n_days: int. Number of days from preprints are to be taken
+            aggregation: str. How the similarity of a preprint to each user
+                paper is combined into its score (see refy.similarity)
+            top_k: int. Number of user papers used by 'top_k_mean'
+            use_cache: bool. If true preprints and parsed libraries
+                are cached on disk
+            cache_path: str, Path. Optional path to the cache's .db file
+            model_path: str, Path. Optional path to a saved TF-IDF model
+            keywords_backend: str. 'textrank' or 'tfidf', see Recomender
+            n_workers: int. Number of processes used to extract keywords
+                from the papers of all users, None for one per CPU core
+
+        Returns:
+            results: dict of user: Results
+
+        Raises:
+            ValueError: if a user has several library files
+    """
+    libraries = sorted(
+        path
+        for path in Path(bib_folder).iterdir()
+        if path.suffix.lower() in loaders
+    )
+    if not libraries:
+        raise FileNotFoundError(f"No library file found in: {bib_folder}")
+
+    # users are named after their library file
+    stems = [library.stem for library in libraries]
+    duplicated = sorted({stem for stem in stems if stems.count(stem) > 1})
+    if duplicated:
+        raise ValueError(
+            f"Several library files for users: {', '.join(duplicated)}, "
+            "each user should have a single file"
+        )
+
+    # load the saved model first, to check that it can be used
+    model = TfidfModel.load(model_path) if model_path is not None else None
+    check_keywords_backend(keywords_backend, model)
+
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    logger.debug(f"Batch recommendation for {len(libraries)} users")
+
+    # load data
+    cache = PreprintsCache(cache_path) if use_cache else None
+    library_cache = LibraryCache(cache_path) if use_cache else None
+    keywords_cache = KeywordsCache(cache_path) if use_cache else None
+
+    papers, abstracts = fetch_preprints(n_days, cache=cache)
+    papers = papers.reset_index(drop=True)
+    users = {
+        library.stem: load_user_input(library, cache=library_cache)
+        for library in libraries
+    }
+    for user in [user for user, data in users.items() if data.empty]:
+        logger.warning(f"No paper with an abstract for {user}, skipping")
+        del users[user]
+
+    # fit a single model on all preprints and user papers
+    user_abstracts, offsets = {}, [0]
+    for user, data in users.items():
+        user_abstracts.update(
+            {f"{user}/{n}": abs for n, abs in enumerate(data.abstract)}
+        )
+        offsets.append(len(user_abstracts))
+
+    embeddings = fit_tfidf(abstracts, user_abstracts, model=model)
+    if model is not None:
+        model.save(model_path)
+
+    # score all users at once
+    scores = compute_group_similarity(
+        embeddings.rows(papers.id),
+        embeddings.rows(user_abstracts.keys()),
+        offsets,
+        aggregation=aggregation,
+        top_k=top_k,
+    )
+
+    # extract keywords from the papers of all users at once
+    if keywords_backend == "textrank":
+        papers_keywords = get_papers_keywords(
+            list(user_abstracts.values()), n_workers, cache=keywords_cache
+        )
+
+    # save each user's results
+    today = date_to_string(datetime.today())
+    results = {}
+    for n, user in enumerate(users):
+        best = top_n(scores[:, n], N)
+
+        results[user] = Results()
+        results[user].fill(papers.iloc[best], N=N, ignore_authors=True)
+        results[user].suggestions.set_score(scores[best, n])
+        if keywords_backend == "tfidf":
+            results[user].keywords = get_tfidf_keywords(
+                embeddings, list(user_abstracts)[offsets[n] : offsets[n + 1]]
+            )
+        else:
+            results[user].keywords = combine_keywords(
+                papers_keywords[offsets[n] : offsets[n + 1]]
+            )
+
+        results[user].to_html(
+            output_folder / f"{user}.html",
+            text=f"[{orange}]:calendar:  Daily suggestions for: [{green} bold]{today}\n\n",
+        )
+        results[user].to_csv(output_folder / f"{user}.csv")
+
+    logger.debug(f"Saved results for {len(results)} users to {output_folder}")
+    return results
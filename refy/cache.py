@@ -0,0 +1,474 @@
+import sqlite3
+import json
+from contextlib import closing, contextmanager
+from pathlib import Path
+from datetime import datetime, timedelta
+import pandas as pd
+from loguru import logger
+
+from refy.utils import string_to_date, date_to_string
+from refy.settings import cache_folder
+from refy.download import IncompleteDownloadError
+
+
+class SQLiteCache:
+    tables = []  # CREATE TABLE statements
+
+    def __init__(self, path=None):
+        """
+            Base class for caches storing data in a SQLite database
+
+            Arguments:
+                path: str, Path. Path to the .db file. By default it's stored
+                    in refy's cache folder.
+        """
+        self.path = Path(path or cache_folder / "cache.db")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._connect() as db:
+            for table in self.tables:
+                db.execute(table)
+
+    @contextmanager
+    def _connect(self):
+        """
+            Opens a connection to the database, committing the changes
+            (or rolling them back on errors) and closing it on exit
+        """
+        with closing(sqlite3.connect(str(self.path))) as db:
+            with db:
+                yield db
+
+
+class PreprintsCache(SQLiteCache):
+    tables = [
+        "CREATE TABLE IF NOT EXISTS days "
+        "(source TEXT, day TEXT, n_papers INTEGER, "
+        "PRIMARY KEY (source, day))",
+        "CREATE TABLE IF NOT EXISTS preprints "
+        "(source TEXT, day TEXT, id TEXT, record TEXT, "
+        "PRIMARY KEY (source, day, id))",
+    ]
+
+    # days after which the preprints of a day are final, for each source.
+    # arxiv's dates are submission dates and papers submitted from Friday
+    # to Sunday are only announced on Monday evening (later around holidays)
+    final_after = dict(arxiv=5, biorxiv=2)
+
+    def __init__(self, path=None, final_after=None):
+        """
+            Local store of preprints metadata and abstracts, partitioned
+            by source and day of publication and saved to a SQLite database.
+            Only days that are old enough for the online databases not to change
+            anymore ('final' days) are stored, so that more recent days are
+            always downloaded again.
+
+            Arguments:
+                path: str, Path. Path to the .db file. By default it's stored
+                    in refy's cache folder.
+                final_after: dict. Optional number of days after which the
+                    preprints released on a given day are considered final,
+                    for each source (e.g. dict(arxiv=7) around holidays).
+        """
+        super().__init__(path)
+        self.final_after = {**self.final_after, **(final_after or {})}
+
+    @staticmethod
+    def _days(start_date, end_date):
+        """
+            Returns a list of str with all days between two dates (included)
+        """
+        start, end = string_to_date(start_date), string_to_date(end_date)
+        return [
+            date_to_string(start + timedelta(n))
+            for n in range((end - start).days + 1)
+        ]
+
+    def is_final(self, source, day, today=None):
+        """
+            Checks if a day is old enough for its preprints to be stored
+
+            Arguments:
+                source: str. Name of the preprints source
+                day: str. Date in YYYY-MM-DD format
+                today: str. Optional, date in YYYY-MM-DD format of the
+                    current day
+        """
+        today = string_to_date(today) if today else datetime.today().date()
+        final_after = self.final_after.get(
+            source, max(self.final_after.values())
+        )
+        return string_to_date(day) <= today - timedelta(final_after)
+
+    def stored_days(self, source, start_date, end_date):
+        """
+            Returns the set of days between two dates that are in the cache
+
+            Arguments:
+                source: str. Name of the preprints source (e.g. arxiv)
+                start_date, end_date: str. Dates in YYYY-MM-DD format
+        """
+        with self._connect() as db:
+            days = db.execute(
+                "SELECT day FROM days WHERE source=? AND day>=? AND day<=?",
+                (source, start_date, end_date),
+            ).fetchall()
+        return {day for (day,) in days}
+
+    def load(self, source, days):
+        """
+            Loads cached preprints released in a set of days
+
+            Arguments:
+                source: str. Name of the preprints source
+                days: list of str with dates in YYYY-MM-DD format
+
+            Returns:
+                papers: pd.DataFrame with papers metadata
+        """
+        days = sorted(days)
+        if not days:
+            return pd.DataFrame()
+
+        with self._connect() as db:
+            records = db.execute(
+                "SELECT record FROM preprints WHERE source=? "
+                + f"AND day IN ({', '.join('?' * len(days))})",
+                (source, *days),
+            ).fetchall()
+        return pd.DataFrame([json.loads(record) for (record,) in records])
+
+    def save(self, source, papers, days, date_column):
+        """
+            Stores preprints released on a set of days. Days without
+            any preprint are stored too, so they are not downloaded again.
+
+            Arguments:
+                source: str. Name of the preprints source
+                papers: pd.DataFrame with papers metadata
+                days: list of str with the days to store
+                date_column: str. Name of the column with publication dates
+        """
+        if papers.empty:
+            records = {day: [] for day in days}
+        else:
+            papers_days = papers[date_column].astype(str).str[:10].values
+            records = {
+                day: papers.loc[papers_days == day].to_dict(orient="records")
+                for day in days
+            }
+
+        with self._connect() as db:
+            for day, day_records in records.items():
+                db.executemany(
+                    "INSERT OR REPLACE INTO preprints VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            source,
+                            day,
+                            record["id"],
+                            json.dumps(record, default=str),
+                        )
+                        for record in day_records
+                    ],
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO days VALUES (?, ?, ?)",
+                    (source, day, len(day_records)),
+                )
+        logger.debug(f"Cached {source} preprints for {len(days)} days")
+
+    def fetch(self, source, download, today, start_date, date_column):
+        """
+            Gets the preprints released between two dates, reading them from
+            the cache when possible and downloading only the days that are
+            missing or not final yet.
+
+            Arguments:
+                source: str. Name of the preprints source
+                download: function. Called as download(today, start_date) to
+                    download preprints from the online database. If it raises
+                    an IncompleteDownloadError the preprints it downloaded are
+                    used, but only the days it reports as complete are cached,
+                    the others are downloaded again at the next run
+                today, start_date: str. Dates in YYYY-MM-DD format
+                date_column: str. Name of the column with publication dates
+
+            Returns:
+                papers: pd.DataFrame with papers metadata
+        """
+        days = self._days(start_date, today)
+        stored = self.stored_days(source, start_date, today)
+        missing = [day for day in days if day not in stored]
+        logger.debug(
+            f"{source} cache has {len(stored)}/{len(days)} days, downloading {len(missing)} days"
+        )
+
+        papers = [self.load(source, stored)]
+        if missing:
+            try:
+                downloaded = download(missing[-1], missing[0])
+                complete_after = None
+            except IncompleteDownloadError as error:
+                logger.warning(f"Incomplete download: {error}")
+                downloaded = error.papers
+                complete_after = error.complete_after or missing[-1]
+
+            if not downloaded.empty:
+                downloaded_days = downloaded[date_column].astype(str).str[:10]
+                downloaded = downloaded.loc[
+                    downloaded_days.isin(missing).values
+                ]
+            papers.append(downloaded)
+
+            final = [
+                day
+                for day in missing
+                if self.is_final(source, day, today)
+                and (complete_after is None or day > complete_after)
+            ]
+            if final:
+                self.save(source, downloaded, final, date_column)
+
+        papers = [ppr for ppr in papers if not ppr.empty]
+        if not papers:
+            return pd.DataFrame()
+        return pd.concat(papers, ignore_index=True)
+
+
+class LibraryCache(SQLiteCache):
+    tables = [
+        "CREATE TABLE IF NOT EXISTS library_files "
+        "(hash TEXT PRIMARY KEY, entries TEXT)",
+        "CREATE TABLE IF NOT EXISTS library_entries "
+        "(hash TEXT PRIMARY KEY, record TEXT)",
+    ]
+
+    def __init__(self, path=None):
+        """
+            Local store of parsed user library entries. Entries are indexed
+            by a hash of their raw text, and each library file by a hash of its
+            content, so that unchanged files and entries are not parsed again.
+
+            Arguments:
+                path: str, Path. Path to the .db file. By default it's stored
+                    in refy's cache folder.
+        """
+        super().__init__(path)
+
+    def get_file(self, file_hash):
+        """
+            Returns the list of entries hashes of a cached
+            library file, or None if the file is not cached
+
+            Arguments:
+                file_hash: str. Hash of the file's content
+        """
+        with self._connect() as db:
+            entries = db.execute(
+                "SELECT entries FROM library_files WHERE hash=?", (file_hash,)
+            ).fetchone()
+        return json.loads(entries[0]) if entries is not None else None
+
+    def put_file(self, file_hash, entries_hashes):
+        """
+            Stores the list of entries hashes of a library file
+
+            Arguments:
+                file_hash: str. Hash of the file's content
+                entries_hashes: list of str with the hash of each entry
+        """
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO library_files VALUES (?, ?)",
+                (file_hash, json.dumps(list(entries_hashes))),
+            )
+
+    def get_entries(self, hashes):
+        """
+            Returns the cached entries among a list of entries hashes
+
+            Arguments:
+                hashes: list of str with entries hashes
+
+            Returns:
+                entries: dict of hash: entry
+        """
+        hashes = list(hashes)
+        entries = {}
+        with self._connect() as db:
+            # query in batches to stay below SQLite's variables limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start : start + 500]
+                entries.update(
+                    {
+                        entry_hash: json.loads(record)
+                        for entry_hash, record in db.execute(
+                            "SELECT hash, record FROM library_entries "
+                            + f"WHERE hash IN ({', '.join('?' * len(batch))})",
+                            batch,
+                        )
+                    }
+                )
+        return entries
+
+    def put_entries(self, entries):
+        """
+            Stores parsed library entries
+
+            Arguments:
+                entries: dict of hash: entry
+        """
+        with self._connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO library_entries VALUES (?, ?)",
+                [
+                    (entry_hash, json.dumps(entry, default=str))
+                    for entry_hash, entry in entries.items()
+                ],
+            )
+        logger.debug(f"Cached {len(entries)} library entries")
+
+
+class KeywordsCache(SQLiteCache):
+    tables = [
+        "CREATE TABLE IF NOT EXISTS keywords "
+        "(hash TEXT PRIMARY KEY, keywords TEXT)",
+    ]
+
+    def __init__(self, path=None):
+        """
+            Local store of the keywords extracted from each
+            abstract, indexed by a hash of the abstract's text.
+
+            Arguments:
+                path: str, Path. Path to the .db file. By default it's stored
+                    in refy's cache folder.
+        """
+        super().__init__(path)
+
+    def get(self, hashes):
+        """
+            Returns the cached keywords among a list of abstracts hashes
+
+            Arguments:
+                hashes: list of str with abstracts hashes
+
+            Returns:
+                keywords: dict of hash: list of str
+        """
+        hashes = list(hashes)
+        keywords = {}
+        with self._connect() as db:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start : start + 500]
+                keywords.update(
+                    {
+                        text_hash: json.loads(kwds)
+                        for text_hash, kwds in db.execute(
+                            "SELECT hash, keywords FROM keywords "
+                            + f"WHERE hash IN ({', '.join('?' * len(batch))})",
+                            batch,
+                        )
+                    }
+                )
+        return keywords
+
+    def put(self, keywords):
+        """
+            Stores the keywords of a set of abstracts
+
+            Arguments:
+                keywords: dict of hash: list of str
+        """
+        with self._connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO keywords VALUES (?, ?)",
+                [
+                    (text_hash, json.dumps(list(kwds)))
+                    for text_hash, kwds in keywords.items()
+                ],
+            )
+
+
+class ScoresCache(SQLiteCache):
+    tables = [
+        "CREATE TABLE IF NOT EXISTS abstract_scores "
+        "(library TEXT, model TEXT, abstract TEXT, score REAL, day TEXT, "
+        "PRIMARY KEY (library, model, abstract))",
+    ]
+
+    def __init__(self, path=None, keep_days=30):
+        """
+            Local store of the scores of preprints for a user library, indexed
+            by a hash of the library, the version of the TF-IDF model that
+            vectorized them and a hash of the preprint's abstract. When the
+            library or the model change their hash or version change too,
+            so old scores are never used again.
+
+            Arguments:
+                path: str, Path. Path to the .db file. By default it's stored
+                    in refy's cache folder.
+                keep_days: int. Scores older than this are removed
+        """
+        self.keep_days = keep_days
+        super().__init__(path)
+
+    def get(self, library, model, abstracts):
+        """
+            Returns the cached scores of a set of preprints
+
+            Arguments:
+                library: str. Hash of the user library
+                model: str. Version of the TF-IDF model
+                abstracts: list of str with hashes of the preprints abstracts
+
+            Returns:
+                scores: dict of abstract hash: score
+        """
+        abstracts = list(abstracts)
+        scores = {}
+        with self._connect() as db:
+            for start in range(0, len(abstracts), 500):
+                batch = abstracts[start : start + 500]
+                scores.update(
+                    db.execute(
+                        "SELECT abstract, score FROM abstract_scores "
+                        "WHERE library = ? AND model = ? "
+                        + f"AND abstract IN ({', '.join('?' * len(batch))})",
+                        [library, model, *batch],
+                    )
+                )
+        return scores
+
+    def put(self, library, model, scores):
+        """
+            Stores the scores of a set of preprints, removing scores
+            of the same library from previous model versions and
+            scores older than keep_days
+
+            Arguments:
+                library: str. Hash of the user library
+                model: str. Version of the TF-IDF model
+                scores: dict of abstract hash: score
+        """
+        today = datetime.today().date()
+        with self._connect() as db:
+            db.execute(
+                "DELETE FROM abstract_scores "
+                "WHERE (library = ? AND model != ?) OR day < ?",
+                (
+                    library,
+                    model,
+                    date_to_string(today - timedelta(self.keep_days)),
+                ),
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO abstract_scores "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (library, model, h, float(score), date_to_string(today))
+                    for h, score in scores.items()
+                ],
+            )
+        logger.debug(f"Cached {len(scores)} preprints scores")
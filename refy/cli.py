@@ -0,0 +1,131 @@
+import typer
+
+app = typer.Typer()
+
+
+@app.command()
+def serve(
+    libraries: str = typer.Option(
+        None, help="Folder with .bib files that can be requested by name"
+    ),
+    host: str = typer.Option("127.0.0.1", help="Address to listen on"),
+    port: int = typer.Option(8000, help="Port to listen on"),
+    n_days: int = typer.Option(7, help="Number of days of preprints"),
+    N: int = typer.Option(10, "-N", help="Default number of suggestions"),
+    refresh_every: float = typer.Option(
+        6, help="Hours between preprints refreshes"
+    ),
+    debug: bool = typer.Option(False, help="Show debug logs"),
+):
+    """
+        Start a refy service that keeps recent preprints in memory
+        and serves suggestions for .bib libraries over HTTP
+    """
+    import refy
+    from refy.service import Service
+
+    if debug:
+        refy.set_logging("DEBUG")
+
+    Service(
+        libraries_folder=libraries,
+        n_days=n_days,
+        N=N,
+        refresh_every=refresh_every,
+    ).serve(host=host, port=port)
+
+
+@app.command()
+def batch(
+    bib_folder: str = typer.Argument(..., help="Folder with users .bib files"),
+    output_folder: str = typer.Argument(..., help="Where to save results"),
+    N: int = typer.Option(10, "-N", help="Number of suggestions per user"),
+    n_days: int = typer.Option(2, help="Number of days of preprints"),
+    aggregation: str = typer.Option(
+        "median", help="median, mean, max or top_k_mean"
+    ),
+    model_path: str = typer.Option(None, help="Path to a saved TF-IDF model"),
+    keywords_backend: str = typer.Option("textrank", help="textrank or tfidf"),
+    n_workers: int = typer.Option(
+        1, help="Number of processes extracting keywords"
+    ),
+    debug: bool = typer.Option(False, help="Show debug logs"),
+):
+    """
+        Suggest preprints to every user with a .bib file in a folder,
+        saving a .html and a .csv file for each user
+    """
+    import refy
+    from refy.batch import batch_recommend
+
+    if debug:
+        refy.set_logging("DEBUG")
+
+    batch_recommend(
+        bib_folder,
+        output_folder,
+        N=N,
+        n_days=n_days,
+        aggregation=aggregation,
+        model_path=model_path,
+        keywords_backend=keywords_backend,
+        n_workers=n_workers,
+    )
+
+
+@app.command()
+def index(
+    index_path: str = typer.Argument(..., help="Where to save the index"),
+    model_path: str = typer.Argument(..., help="Path to the TF-IDF model"),
+    n_days: int = typer.Option(365, help="Number of days of preprints"),
+    n_probe: int = typer.Option(8, help="Number of lists scored by queries"),
+    debug: bool = typer.Option(False, help="Show debug logs"),
+):
+    """
+        Build a vector index of the preprints released in the last n days.
+        Preprints are cached, so only new days are downloaded
+        when the index is built again
+    """
+    import refy
+    from refy.cache import PreprintsCache
+    from refy.download import fetch_preprints
+    from refy.index import build_index
+
+    if debug:
+        refy.set_logging("DEBUG")
+
+    _, abstracts = fetch_preprints(n_days, cache=PreprintsCache())
+    build_index(abstracts, index_path, model_path, n_probe=n_probe)
+
+
+@app.command()
+def search(
+    library: str = typer.Argument(..., help="Path to the user's library"),
+    index_path: str = typer.Argument(..., help="Path to the index"),
+    model_path: str = typer.Argument(..., help="Path to the TF-IDF model"),
+    N: int = typer.Option(10, "-N", help="Number of suggestions"),
+    n_probe: int = typer.Option(None, help="Number of lists to score"),
+    aggregation: str = typer.Option(
+        "top_k_mean", help="median, mean, max or top_k_mean"
+    ),
+    debug: bool = typer.Option(False, help="Show debug logs"),
+):
+    """
+        Suggest papers from an index built with 'refy index'
+    """
+    import refy
+    from refy.index import search_index
+
+    if debug:
+        refy.set_logging("DEBUG")
+
+    papers = search_index(
+        library,
+        index_path,
+        model_path,
+        N=N,
+        n_probe=n_probe,
+        aggregation=aggregation,
+    )
+    for paper in papers.itertuples():
+        print(f"{paper.score:.3f}  {paper.id}")
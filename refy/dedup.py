@@ -0,0 +1,251 @@
+import re
+import string
+from itertools import chain
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from loguru import logger
+
+# version suffix of arxiv IDs
+arxiv_version = re.compile(r"v(\d+)$")
+
+# punctuation is replaced by spaces before splitting abstracts into words
+punctuation = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+# number of consecutive words in each shingle
+shingle_size = 3
+
+# titles with fewer words are not used to find duplicates
+min_title_words = 3
+
+
+def normalize_titles(titles):
+    """
+        Normalizes titles so that the same title written with different
+        case, accents, punctuation or spacing is the same string
+
+        Arguments:
+            titles: pd.Series of str
+
+        Returns:
+            titles: pd.Series of str
+    """
+    return (
+        titles.fillna("")
+        .astype(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", errors="ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(r"[^a-z0-9]+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def _shingles(texts):
+    """
+        Hashes the shingles (sequences of consecutive words) of a set of texts
+
+        Arguments:
+            texts: list of str
+
+        Returns:
+            hashes: np.ndarray of uint64 with the hashes of all shingles
+            offsets: np.ndarray. The shingles of text n are in
+                hashes[offsets[n] : offsets[n+1]]
+    """
+    tokens = [text.lower().translate(punctuation).split() for text in texts]
+    n_tokens = np.array([len(t) for t in tokens], dtype=np.int64)
+    words = np.array(list(chain.from_iterable(tokens)), dtype=object)
+    codes = np.concatenate(
+        [pd.util.hash_array(words), np.zeros(shingle_size, np.uint64)]
+    )
+
+    # a shingle starts at each word followed by shingle_size - 1 words
+    starts = np.concatenate([[0], np.cumsum(n_tokens)[:-1]])
+    n_shingles = np.maximum(n_tokens - shingle_size + 1, 0)
+    position = np.arange(len(codes) - shingle_size) - np.repeat(
+        starts, n_tokens
+    )
+    first = np.flatnonzero(position < np.repeat(n_shingles, n_tokens))
+
+    hashes = np.zeros(len(first), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for n in range(shingle_size):
+            hashes = hashes * np.uint64(1000003) + codes[first + n]
+    offsets = np.concatenate([[0], np.cumsum(n_shingles)])
+    return hashes, offsets
+
+
+def minhash(texts, n_permutations=64, seed=0, chunk_size=1000):
+    """
+        Computes the MinHash signature of a set of texts: for each of
+        n_permutations hash functions the min hash of the text's shingles.
+        The fraction of equal values in the signatures of two texts estimates
+        the Jaccard similarity of their shingles.
+
+        Arguments:
+            texts: list of str
+            n_permutations: int. Length of the signatures
+            seed: int. Seed for the hash functions
+            chunk_size: int. Number of texts hashed at once
+
+        Returns:
+            signatures: np.ndarray of uint32 of shape n texts x n_permutations.
+                Texts without shingles have all values equal to the max uint32
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, n_permutations, dtype=np.uint64)
+    a |= np.uint64(1)  # multiply-shift hashing needs odd multipliers
+    b = rng.integers(0, 2 ** 63, n_permutations, dtype=np.uint64)
+
+    signatures = np.full(
+        (len(texts), n_permutations), np.iinfo(np.uint32).max, np.uint32
+    )
+    for start in range(0, len(texts), chunk_size):
+        hashes, offsets = _shingles(texts[start : start + chunk_size])
+        has_shingles = np.flatnonzero(np.diff(offsets) > 0)
+        if not len(has_shingles):
+            continue
+
+        for n in range(n_permutations):
+            with np.errstate(over="ignore"):
+                permuted = ((a[n] * hashes + b[n]) >> np.uint64(32)).astype(
+                    np.uint32
+                )
+            signatures[start + has_shingles, n] = np.minimum.reduceat(
+                permuted, offsets[has_shingles]
+            )
+    return signatures
+
+
+def _same_key_pairs(keys, valid):
+    """
+        Pairs each item with the first item with the same key
+
+        Arguments:
+            keys: np.ndarray with one key per item
+            valid: np.ndarray of bool, items that can be paired
+
+        Returns:
+            first, other: np.ndarray of int, indices of paired items
+    """
+    items = np.flatnonzero(valid)
+    items = items[np.argsort(keys[items], kind="stable")]
+    sorted_keys = keys[items]
+
+    is_first = np.ones(len(items), dtype=bool)
+    is_first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    first = np.maximum.accumulate(np.where(is_first, np.arange(len(items)), 0))
+    return items[first[~is_first]], items[~is_first]
+
+
+def _lsh_pairs(signatures, n_bands, threshold):
+    """
+        Finds pairs of texts with similar MinHash signatures with
+        locality sensitive hashing: signatures are split in bands and texts
+        with an identical band are candidate pairs, kept if the estimated
+        similarity of their shingles is at least threshold.
+
+        Returns:
+            first, other: np.ndarray of int, indices of paired texts
+    """
+    valid = signatures[:, 0] != np.iinfo(np.uint32).max
+    rows = signatures.shape[1] // n_bands
+    pairs = []
+    with np.errstate(over="ignore"):
+        for band in range(n_bands):
+            keys = np.zeros(len(signatures), dtype=np.uint64)
+            for value in signatures[:, band * rows : (band + 1) * rows].T:
+                keys = keys * np.uint64(0x100000001B3) + value.astype(
+                    np.uint64
+                )
+            pairs.append(_same_key_pairs(keys, valid))
+
+    first = np.concatenate([p[0] for p in pairs])
+    other = np.concatenate([p[1] for p in pairs])
+    similarity = (signatures[first] == signatures[other]).mean(axis=1)
+    keep = similarity >= threshold
+    return first[keep], other[keep]
+
+
+def deduplicate(
+    papers, abstracts, threshold=0.8, n_permutations=64, n_bands=16, seed=0
+):
+    """
+        Merges preprints that are the same work: several versions of an
+        arxiv preprint, papers with the same (normalized) title and papers
+        whose abstracts are near duplicates. Near duplicates are found
+        with MinHash signatures of the abstracts' shingles and locality
+        sensitive hashing, so that the cost grows linearly with the number
+        of papers. Papers linked by any of these are merged in a single record:
+        the one with the highest arxiv version or, with the same version,
+        the longest abstract. Missing DOIs are taken from merged papers.
+
+        Arguments:
+            papers: pd.DataFrame with papers metadata
+                (see refy.download.clean_preprints)
+            abstracts: dict of ID: abstract
+            threshold: float. Min estimated Jaccard similarity of the
+                abstracts' shingles for papers to be merged
+            n_permutations: int. Length of MinHash signatures
+            n_bands: int. Number of LSH bands, must divide n_permutations
+            seed: int. Seed for the MinHash functions
+
+        Returns:
+            papers: pd.DataFrame with the metadata of unique papers
+            abstracts: dict of ID: abstract of unique papers
+    """
+    papers = papers.reset_index(drop=True)
+    n_papers = len(papers)
+    if n_papers < 2:
+        return papers, abstracts
+    texts = [
+        a if isinstance(a, str) else ""
+        for a in (abstracts.get(ID) for ID in papers["id"])
+    ]
+
+    # versions of the same arxiv preprint
+    ids = papers["id"].astype(str)
+    version = pd.to_numeric(
+        ids.str.extract(arxiv_version, expand=False), errors="coerce"
+    ).fillna(0)
+    is_arxiv = (papers["source"].astype(str) == "arxiv").values
+    base_ids = ids.str.replace(arxiv_version, "", regex=True)
+    pairs = [_same_key_pairs(pd.factorize(base_ids)[0], is_arxiv)]
+
+    # same title
+    titles = normalize_titles(papers["title"])
+    pairs.append(
+        _same_key_pairs(
+            pd.factorize(titles)[0],
+            (titles.str.count(" ") + 1 >= min_title_words).values,
+        )
+    )
+
+    # near duplicate abstracts
+    signatures = minhash(texts, n_permutations=n_permutations, seed=seed)
+    pairs.append(_lsh_pairs(signatures, n_bands, threshold))
+
+    # merge papers linked by any pair
+    first = np.concatenate([p[0] for p in pairs])
+    other = np.concatenate([p[1] for p in pairs])
+    graph = sparse.coo_matrix(
+        (np.ones(len(first)), (first, other)), shape=(n_papers, n_papers)
+    )
+    _, labels = connected_components(graph, directed=False)
+
+    papers["doi"] = papers["doi"].groupby(labels).transform("first")
+    order = np.lexsort(([len(t) for t in texts], version.values, labels))
+    is_last = np.ones(n_papers, dtype=bool)
+    is_last[:-1] = labels[order][1:] != labels[order][:-1]
+    keep = np.sort(order[is_last])
+
+    papers = papers.iloc[keep].reset_index(drop=True)
+    abstracts = {ID: abstracts[ID] for ID in papers["id"] if ID in abstracts}
+    logger.debug(
+        f"Merged {n_papers - len(papers)} duplicate preprints: "
+        f"{len(papers)} unique preprints left"
+    )
+    return papers, abstracts
@@ -1,139 +1,358 @@
 from loguru import logger
-import xmltodict
 import pandas as pd
 import math
 from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+from datetime import datetime, timedelta
 
-from refy.web_utils import request, raise_on_no_connection
-from refy.utils import string_to_date
+from refy.web_utils import Session
+from refy.utils import string_to_date, date_to_string
 from refy.settings import biorxiv_categories, arxiv_categories
+from refy.authors import normalize_authors
+from refy.dedup import deduplicate
 
 biorxiv_base_url = "https://api.biorxiv.org/details/biorxiv/"
 arxiv_base_url = "http://export.arxiv.org/api/query?search_query="
 
+# xml namespaces used by arxiv's Atom feed
+atom_ns = "{http://www.w3.org/2005/Atom}"
+arxiv_ns = "{http://arxiv.org/schemas/atom}"
 
-def download_biorxiv(today, start_date):
+
+class IncompleteDownloadError(RuntimeError):
+    def __init__(self, message, papers, complete_after=None):
+        """
+            Raised when not all preprints could be downloaded,
+            e.g. because of API limitations
+
+            Arguments:
+                message: str
+                papers: pd.DataFrame with the preprints that were downloaded
+                complete_after: str. Optional date in YYYY-MM-DD format,
+                    the preprints released after it were all downloaded
+        """
+        super().__init__(message)
+        self.papers = papers
+        self.complete_after = complete_after
+
+
+def download_biorxiv(
+    today, start_date, session=None, n_workers=8, base_url=biorxiv_base_url
+):
     """
-        Downloads latest biorxiv's preprints, hot off the press
+        Downloads latest biorxiv's preprints, hot off the press.
+        The API returns 100 papers per page, after the first page
+        the remaining ones are downloaded concurrently.
+
+        Arguments:
+            today, start_date: str. Dates in YYYY-MM-DD format
+            session: Session. Optional pooled session to send requests with
+            n_workers: int. Max number of pages downloaded at once
+            base_url: str. Url of biorxiv's API
+
+        Raises:
+            IncompleteDownloadError: if fewer papers than
+                announced by the API were downloaded
     """
-    req = request(biorxiv_base_url + f"{start_date}/{today}", to_json=True)
-    tot = req["messages"][0]["total"]
+    session = session or Session(n_connections=n_workers)
+    url = base_url + f"{start_date}/{today}/"
+
+    # the first page tells how many papers there are
+    first = session.request(url + "0", to_json=True)
+    tot = int(first["messages"][0].get("total", 0))
     logger.debug(
         f"Downloading metadata for {tot} papers from bioarxiv || {start_date} -> {today}"
     )
+    if not tot:
+        return pd.DataFrame(
+            columns=[
+                "id",
+                "doi",
+                "title",
+                "authors",
+                "date",
+                "category",
+                "abstract",
+                "source",
+            ]
+        )
+
+    # download all other pages
+    def download_page(cursor):
+        page = session.request(url + str(cursor), to_json=True)["collection"]
+        logger.debug(f"     downloaded page at cursor {cursor}/{tot}")
+        return page
 
-    # loop over all papers
-    papers, cursor = [], 0
-    while cursor < int(math.ceil(tot / 100.0)) * 100:
-        # download
-        papers.append(
-            request(
-                biorxiv_base_url + f"{start_date}/{today}/{cursor}",
-                to_json=True,
-            )["collection"]
+    cursors = range(100, int(math.ceil(tot / 100.0)) * 100, 100)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        pages = [first["collection"]] + list(
+            executor.map(download_page, cursors)
         )
-        cursor += 100
-        logger.debug(f"     downloaded {cursor/tot * 100:.0f}%")
 
     # clean up
-    papers = pd.concat([pd.DataFrame(ppr) for ppr in papers])
+    papers = pd.concat([pd.DataFrame(ppr) for ppr in pages])
+    n_downloaded = len(papers)
     papers["source"] = "biorxiv"
     papers = papers.loc[papers.category.isin(biorxiv_categories)]
     papers["id"] = papers["doi"]
 
     logger.debug(f"kept {len(papers)} preprints from biorxiv")
+    if n_downloaded < tot:
+        raise IncompleteDownloadError(
+            f"Downloaded {n_downloaded}/{tot} papers from biorxiv", papers
+        )
     return papers
 
 
-@raise_on_no_connection
-def download_arxiv(today, start_date):
+def _arxiv_entry_to_record(entry):
+    """
+        Extracts the fields used by refy from an arxiv's Atom <entry>
+
+        Arguments:
+            entry: xml.etree.ElementTree.Element with the entry
+
+        Returns:
+            paper: dict with paper metadata
+    """
+    link = entry.find(atom_ns + "link")
+    category = entry.find(arxiv_ns + "primary_category")
+
+    return dict(
+        id=entry.findtext(atom_ns + "id", ""),
+        title=entry.findtext(atom_ns + "title", ""),
+        published=entry.findtext(atom_ns + "published", "").split("T")[0],
+        authors=[
+            author.findtext(atom_ns + "name", "")
+            for author in entry.iterfind(atom_ns + "author")
+        ],
+        abstract=entry.findtext(atom_ns + "summary", ""),
+        url=link.get("href") if link is not None else None,
+        category=category.get("term") if category is not None else None,
+    )
+
+
+def parse_arxiv_entries(chunks):
+    """
+        Incrementally parses an arxiv's Atom feed, yielding a compact
+        record for each entry as soon as its xml has been received.
+        Parsed entries are removed from the tree so memory use does
+        not grow with the size of the feed.
+
+        Arguments:
+            chunks: iterable of bytes with the feed's content
+
+        Yields:
+            paper: dict with paper metadata
+    """
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = None
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if root is None and event == "start":
+                root = element
+            elif event == "end" and element.tag == atom_ns + "entry":
+                paper = _arxiv_entry_to_record(element)
+                root.remove(element)
+
+                if "api/errors" in paper["id"]:
+                    raise ValueError(
+                        f"Querying Arxiv API returned an error: {paper['abstract']}"
+                    )
+                yield paper
+    parser.close()
+
+
+def download_arxiv(today, start_date, session=None, base_url=arxiv_base_url):
+    """
+        get papers from arxiv.
+        Papers are requested from the most to the least recent
+        and parsed while they are downloaded, downloading stops as soon as
+        a paper older than start_date is found
+
+        Arguments:
+            today, start_date: str. Dates in YYYY-MM-DD format
+            session: Session. Optional pooled session to send requests with
+            base_url: str. Url of arxiv's API
+
+        Raises:
+            IncompleteDownloadError: if arxiv stopped returning
+                papers before reaching start_date
     """
-            get papers from arxiv
-        """
     logger.debug(f"downloading papers from arxiv. || {start_date} -> {today}")
-    today, start_date = string_to_date(today), string_to_date(start_date)
+    start_date = string_to_date(start_date)
+    session = session or Session()
 
     N_results = 500  # per request
     url_end = f"&max_results={N_results}&start=START&sortBy=submittedDate&sortOrder=descending"
     query = "".join([f"cat:{cat}+OR+" for cat in arxiv_categories])[:-4]
 
     count = 0
-    papers, dates = [], []
+    papers = []
     while True:
         logger.debug(
-            f"     sending biorxiv request with start index: {count} (requesting {N_results} papers)"
-            + f' | collected {len(papers)} papers so far | min date: {min(dates) if dates else "nan"}'
+            f"     sending arxiv request with start index: {count} (requesting {N_results} papers)"
+            + f" | collected {len(papers)} papers so far"
         )
-        # download arxiv papers
-        url = arxiv_base_url + query + url_end.replace("START", str(count))
+        # download and parse arxiv papers
+        url = base_url + query + url_end.replace("START", str(count))
         logger.debug(f"         request url:\n{url}")
-        data_str = request(url)
-
-        # parse
-        dict_data = xmltodict.parse(data_str)
-        try:
-            downloaded = dict_data["feed"]["entry"]
-        except KeyError:
-            # raise ValueError('Failed to retrieve data from arxiv, likely an API limitation issue, wait a bit.')
+
+        n_entries, reached_start = 0, False
+        entries = parse_arxiv_entries(session.stream(url))
+        for paper in entries:
+            n_entries += 1
+            if string_to_date(paper["published"]) < start_date:
+                reached_start = True
+                break
+            papers.append(paper)
+        entries.close()
+
+        if not n_entries:
             logger.debug(
                 " !!! Failed to retrieve data from arxiv, likely an API limitation issue, wait a bit. !!!"
             )
-            logger.debug(dict_data["feed"])
             break
         else:
-            logger.debug(
-                f"     downloaded {len(downloaded)} papers - filtering"
-            )
+            logger.debug(f"     downloaded {n_entries} papers")
 
-        for paper in downloaded:
-            if isinstance(paper, str):
-                raise ValueError(
-                    f"Querying Arxiv API returned a string: {paper}"
-                )
-            if isinstance(paper["category"], list):
-                paper["category"] = paper["category"][0]["@term"]
-            else:
-                paper["category"] = paper["category"]["@term"]
-
-        # store results
-        _dates = [
-            string_to_date(paper["published"].split("T")[0])
-            for paper in downloaded
-        ]
-        papers.extend(downloaded)
-        dates.extend(_dates)
-
-        if min(dates) < start_date:
+        if reached_start:
             break
         else:
             sleep(20)  # to avoid exceeding API restrictions
-            count += len(papers)
-
-    # keep only papers in the right date range
-    papers = [
-        paper for date, paper in zip(dates, papers) if date >= start_date
-    ]
+            count += n_entries
 
     # organize in a dataframe and return
-    _papers = dict(
-        id=[], title=[], published=[], authors=[], abstract=[], url=[]
+    papers = pd.DataFrame(
+        papers,
+        columns=[
+            "id",
+            "title",
+            "published",
+            "authors",
+            "abstract",
+            "url",
+            "category",
+        ],
     )
-    for paper in papers:
-        _papers["id"].append(paper["id"])
-        _papers["title"].append(paper["title"])
-        _papers["published"].append(paper["published"].split("T")[0])
-        _papers["abstract"].append(paper["summary"])
-        _papers["url"].append(paper["link"][0]["@href"])
-
-        if isinstance(paper["author"], list):
-            _papers["authors"].append(
-                [auth["name"] for auth in paper["author"]]
-            )
-        else:
-            _papers["authors"].append(paper["author"])  # single author
-
-    papers = pd.DataFrame(_papers)
     papers["source"] = "arxiv"
 
     logger.debug(f"Downloaded {len(papers)} preprints from arxiv")
+    if not reached_start:
+        # papers come from the most recent, so the days after
+        # the oldest paper that was downloaded are complete
+        raise IncompleteDownloadError(
+            f"Arxiv stopped returning papers before {date_to_string(start_date)}",
+            papers,
+            complete_after=papers.published.min() if len(papers) else None,
+        )
     return papers
+
+
+def download_all(download, today, start_date):
+    """
+        Downloads preprints with a download function, keeping the
+        preprints that were downloaded when the download is incomplete
+
+        Arguments:
+            download: function. download_arxiv or download_biorxiv
+            today, start_date: str. Dates in YYYY-MM-DD format
+
+        Returns:
+            papers: pd.DataFrame with papers metadata
+    """
+    try:
+        return download(today, start_date)
+    except IncompleteDownloadError as error:
+        logger.warning(f"Incomplete download: {error}")
+        return error.papers
+
+
+def fetch_preprints(n_days, cache=None):
+    """
+        Downloads preprints released in the last n days from the
+        online databases and returns their metadata and abstracts,
+        merging duplicate preprints (see refy.dedup)
+
+        Arguments:
+            n_days: int. Number of days from preprints are to be taken
+            cache: refy.cache.PreprintsCache. Optional, if passed preprints
+                are loaded from the cache for days that were already downloaded
+
+        Returns:
+            papers: pd.DataFrame with papers metadata
+            abstracts: dict of ID: abstract
+    """
+    # get dates
+    today = date_to_string(datetime.today())
+    start_date = date_to_string(datetime.now() - timedelta(n_days))
+
+    # download (or load from cache)
+    if cache is None:
+        papers = pd.concat(
+            [
+                download_all(download_arxiv, today, start_date),
+                download_all(download_biorxiv, today, start_date),
+            ]
+        )
+    else:
+        papers = pd.concat(
+            [
+                cache.fetch(
+                    "arxiv", download_arxiv, today, start_date, "published"
+                ),
+                cache.fetch(
+                    "biorxiv", download_biorxiv, today, start_date, "date"
+                ),
+            ]
+        )
+
+    return deduplicate(*clean_preprints(papers))
+
+
+def clean_preprints(papers):
+    """
+        Keeps the preprints metadata used by refy, fixes the year
+        of publication and separates the abstracts from the metadata
+
+        Arguments:
+            papers: pd.DataFrame with preprints from all sources
+
+        Returns:
+            papers: pd.DataFrame with papers metadata
+            abstracts: dict of ID: abstract
+    """
+    # cleanup
+    papers = papers.reset_index(drop=True).reindex(
+        columns=[
+            "id",
+            "doi",
+            "title",
+            "authors",
+            "date",
+            "published",
+            "category",
+            "abstract",
+            "source",
+            "url",
+        ]
+    )
+
+    # store authors as lists of names
+    papers["authors"] = normalize_authors(papers)
+    papers["source"] = papers["source"].astype("category")
+
+    # fix year of publication (arxiv papers only have a publication date)
+    dates = papers["date"].fillna(papers["published"]).astype("string")
+    papers["year"] = dates.str.split("-").str[0].fillna("2021").astype(str)
+    del papers["date"], papers["published"]
+
+    # separate abstracts
+    abstracts = dict(zip(papers["id"], papers["abstract"]))
+    del papers["abstract"]
+
+    # make sure everything checks out
+    papers = papers.drop_duplicates(subset="id")
+
+    return papers, abstracts
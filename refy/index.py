@@ -0,0 +1,424 @@
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+import pandas as pd
+from pathlib import Path
+from loguru import logger
+
+from refy.similarity import compute_similarity, aggregate, top_n
+from refy.input import load_user_input
+
+
+def _top_terms(matrix, n_terms):
+    """
+        Keeps only the n_terms largest entries in each row of
+        a sparse matrix and normalizes the rows
+
+        Arguments:
+            matrix: scipy.sparse.csr_matrix
+            n_terms: int
+
+        Returns:
+            matrix: scipy.sparse.csr_matrix
+    """
+    matrix = matrix.tocsr()
+    data, indices, indptr = [], [], [0]
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        keep = np.argsort(matrix.data[start:end])[::-1][:n_terms] + start
+        data.append(matrix.data[keep])
+        indices.append(matrix.indices[keep])
+        indptr.append(indptr[-1] + len(keep))
+
+    pruned = sparse.csr_matrix(
+        (
+            np.concatenate(data) if data else [],
+            np.concatenate(indices) if indices else [],
+            indptr,
+        ),
+        shape=matrix.shape,
+    )
+    return normalize(pruned)
+
+
+class VectorIndex:
+    def __init__(
+        self, n_lists=None, n_probe=8, centroid_terms=256, seed=0
+    ):
+        """
+            Approximate nearest neighbours index for TF-IDF vectors of a
+            large archive of papers (inverted file index).
+            Vectors are clustered with spherical k-means and each is stored
+            in the list of its closest centroid. When querying, only the lists
+            whose centroids are most similar to the user's papers are scored
+            exactly, so the cost of a query doesn't grow with the archive.
+
+            The user vectors must be computed with the same TF-IDF model
+            used for the archive (see refy.infer.TfidfModel).
+
+            Arguments:
+                n_lists: int. Number of clusters, by default the square root
+                    of the number of vectors
+                n_probe: int. Number of lists scored at each query
+                centroid_terms: int. Number of terms kept in each centroid,
+                    limits the index size with large vocabularies
+                seed: int. Seed for the random number generator
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.centroid_terms = centroid_terms
+        self.seed = seed
+
+        self.IDs = np.array([], dtype=str)
+        self.model_version = ""  # of the TF-IDF model, see build_index
+        self.vectors = None
+        self.centroids = None
+        self.order = None  # vectors indices sorted by list
+        self.offsets = None  # where each list starts in order
+
+    def __len__(self):
+        return len(self.IDs)
+
+    def _assign(self, vectors, chunk_size=4096):
+        """
+            Returns the index of the most similar centroid for each vector
+        """
+        assignments = np.zeros(vectors.shape[0], dtype=np.int64)
+        centroids = self.centroids.T.tocsc()
+        for start in range(0, vectors.shape[0], chunk_size):
+            chunk = vectors[start : start + chunk_size]
+            similarity = (chunk @ centroids).toarray()
+            assignments[start : start + chunk_size] = similarity.argmax(1)
+        return assignments
+
+    def build(self, vectors, IDs, n_iter=10, sample_size=20000):
+        """
+            Builds the index by clustering a sample of vectors and
+            assigning every vector to the list of its closest centroid
+
+            Arguments:
+                vectors: scipy.sparse matrix with one row per paper
+                IDs: list of str with each paper's ID
+                n_iter: int. Number of k-means iterations
+                sample_size: int. Number of vectors used to fit the centroids
+
+            Returns:
+                self
+        """
+        rng = np.random.default_rng(self.seed)
+        self.vectors = normalize(sparse.csr_matrix(vectors))
+        self.IDs = np.array(list(IDs), dtype=str)
+        n = self.vectors.shape[0]
+
+        n_lists = self.n_lists or int(np.ceil(np.sqrt(n)))
+        self.n_lists = n_lists = max(1, min(n_lists, n))
+        logger.debug(f"Building vector index: {n} vectors in {n_lists} lists")
+
+        # fit centroids with spherical k-means on a sample
+        sample_size = min(n, max(sample_size, n_lists))
+        sample = self.vectors[rng.choice(n, size=sample_size, replace=False)]
+        self.centroids = _top_terms(
+            sample[rng.choice(sample.shape[0], n_lists, replace=False)],
+            self.centroid_terms,
+        )
+        for iteration in range(n_iter):
+            assignments = self._assign(sample)
+            members = sparse.csr_matrix(
+                (
+                    np.ones(len(assignments)),
+                    (assignments, np.arange(len(assignments))),
+                ),
+                shape=(n_lists, sample.shape[0]),
+            )
+            centroids = _top_terms(members @ sample, self.centroid_terms)
+
+            # keep the previous centroid for empty clusters
+            empty = np.diff(centroids.indptr) == 0
+            if empty.any():
+                centroids = sparse.vstack(
+                    [
+                        self.centroids[i] if empty[i] else centroids[i]
+                        for i in range(n_lists)
+                    ],
+                    format="csr",
+                )
+            self.centroids = centroids
+
+        # store each vector in its list
+        assignments = self._assign(self.vectors)
+        self.order = np.argsort(assignments, kind="stable")
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]
+        )
+        return self
+
+    def _match_dimensions(self, user_vectors):
+        """
+            Makes the user vectors the same width as the index'
+            vectors (terms added to the model after the index was
+            built are absent from all indexed vectors anyway)
+        """
+        user_vectors = sparse.csr_matrix(user_vectors)
+        n_terms = self.vectors.shape[1]
+        if user_vectors.shape[1] > n_terms:
+            return user_vectors[:, :n_terms]
+        elif user_vectors.shape[1] < n_terms:
+            user_vectors = user_vectors.copy()
+            user_vectors.resize((user_vectors.shape[0], n_terms))
+        return user_vectors
+
+    def candidates(
+        self, user_vectors, n_probe=None, aggregation="median", top_k=5
+    ):
+        """
+            Selects the papers in the lists whose centroids
+            are most similar to the user papers
+
+            Arguments:
+                user_vectors: sparse matrix with one row per user paper
+                n_probe: int. Number of lists to select
+                aggregation: str. How to aggregate the similarity of each
+                    centroid to all user papers (see refy.similarity)
+                top_k: int. Number of user papers used by 'top_k_mean'
+
+            Returns:
+                candidates: np.ndarray with indices of selected papers
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        user_vectors = normalize(self._match_dimensions(user_vectors))
+
+        similarity = (self.centroids @ user_vectors.T).toarray()
+        scores = aggregate(similarity, aggregation, top_k=top_k)
+        lists = np.argsort(scores)[::-1][:n_probe]
+
+        return np.concatenate(
+            [self.order[self.offsets[i] : self.offsets[i + 1]] for i in lists]
+        )
+
+    def search(
+        self, user_vectors, N=10, n_probe=None, aggregation="median", top_k=5
+    ):
+        """
+            Returns the top N papers for a user library: candidates are
+            selected with the index and then re-ranked with exact scores
+
+            Arguments:
+                user_vectors: sparse matrix with one row per user paper
+                N: int. Number of papers to return
+                n_probe: int. Number of lists to score
+                aggregation: str. How to aggregate the similarity to
+                    all user papers (see refy.similarity)
+                top_k: int. Number of user papers used by 'top_k_mean'
+
+            Returns:
+                IDs: np.ndarray with the IDs of the top N papers
+                scores: np.ndarray with their scores
+        """
+        user_vectors = self._match_dimensions(user_vectors)
+        candidates = self.candidates(
+            user_vectors, n_probe=n_probe, aggregation=aggregation, top_k=top_k
+        )
+        logger.debug(f"Scoring {len(candidates)}/{len(self)} candidates")
+
+        scores = compute_similarity(
+            self.vectors[candidates],
+            user_vectors,
+            aggregation=aggregation,
+            top_k=top_k,
+        )
+        best = top_n(scores, N)
+        return self.IDs[candidates[best]], scores[best]
+
+    def recall(
+        self, user_vectors, N=10, n_probe=None, aggregation="median", top_k=5
+    ):
+        """
+            Computes the recall@N of the index: the fraction of the exact top N
+            papers (scoring the whole archive) that are found by the index
+
+            Arguments:
+                user_vectors: sparse matrix with one row per user paper
+                N: int. Number of papers to return
+                n_probe: int. Number of lists to score
+                aggregation: str. How to aggregate the similarity to
+                    all user papers (see refy.similarity)
+                top_k: int. Number of user papers used by 'top_k_mean'
+
+            Returns:
+                recall: float
+        """
+        user_vectors = self._match_dimensions(user_vectors)
+        exact = compute_similarity(
+            self.vectors, user_vectors, aggregation=aggregation, top_k=top_k
+        )
+        exact_IDs = self.IDs[top_n(exact, N)]
+        IDs, _ = self.search(
+            user_vectors,
+            N=N,
+            n_probe=n_probe,
+            aggregation=aggregation,
+            top_k=top_k,
+        )
+
+        recall = len(set(IDs) & set(exact_IDs)) / max(1, len(exact_IDs))
+        logger.debug(f"Vector index recall@{N}: {recall:.3f}")
+        return recall
+
+    def save(self, path):
+        """
+            Saves the index to a .npz file (the .npz
+            suffix is added to the path if missing)
+
+            Arguments:
+                path: str, Path. Path to the file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            IDs=self.IDs,
+            vectors_data=self.vectors.data,
+            vectors_indices=self.vectors.indices,
+            vectors_indptr=self.vectors.indptr,
+            vectors_shape=self.vectors.shape,
+            centroids_data=self.centroids.data,
+            centroids_indices=self.centroids.indices,
+            centroids_indptr=self.centroids.indptr,
+            centroids_shape=self.centroids.shape,
+            order=self.order,
+            offsets=self.offsets,
+            settings=[self.n_lists, self.n_probe, self.centroid_terms],
+            model_version=self.model_version,
+        )
+        logger.debug(f"Saved vector index to: {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+            Loads an index from a .npz file (the .npz
+            suffix is added to the path if missing)
+
+            Arguments:
+                path: str, Path. Path to the file
+        """
+        path = Path(path)
+        if path.suffix != ".npz":
+            path = path.with_name(path.name + ".npz")
+        data = np.load(path)
+        n_lists, n_probe, centroid_terms = (int(v) for v in data["settings"])
+
+        index = cls(
+            n_lists=n_lists, n_probe=n_probe, centroid_terms=centroid_terms
+        )
+        index.IDs = data["IDs"]
+        index.model_version = str(data["model_version"])
+        index.vectors = sparse.csr_matrix(
+            (
+                data["vectors_data"],
+                data["vectors_indices"],
+                data["vectors_indptr"],
+            ),
+            shape=tuple(data["vectors_shape"]),
+        )
+        index.centroids = sparse.csr_matrix(
+            (
+                data["centroids_data"],
+                data["centroids_indices"],
+                data["centroids_indptr"],
+            ),
+            shape=tuple(data["centroids_shape"]),
+        )
+        index.order = data["order"]
+        index.offsets = data["offsets"]
+        return index
+
+
+# ------------------------------- archive search ------------------------------ #
+
+
+def _model_version(model):
+    return f"{model.fitted_at.isoformat()}/{model.version}"
+
+
+def build_index(abstracts, index_path, model_path, **kwargs):
+    """
+        Builds a vector index for an archive of papers and saves it.
+        Abstracts are vectorized with a saved TF-IDF model (created if
+        it doesn't exist), which is then needed to query the index.
+        The model should not be used for anything else, otherwise
+        the index needs to be built again whenever the model changes.
+
+        Arguments:
+            abstracts: dict of ID: abstract of the archive's papers
+            index_path: str, Path. Where the index is saved (.npz)
+            model_path: str, Path. Path to the saved TF-IDF model
+            kwargs: passed to VectorIndex
+
+        Returns:
+            index: VectorIndex
+    """
+    from refy.infer import fit_tfidf, TfidfModel  # slow to import
+
+    model = TfidfModel.load(model_path)
+    embeddings = fit_tfidf(abstracts, {}, model=model)
+    model.save(model_path)
+
+    index = VectorIndex(**kwargs).build(embeddings.matrix, embeddings.IDs)
+    index.model_version = _model_version(model)
+    index.save(index_path)
+    return index
+
+
+def search_index(
+    user_data_filepath,
+    index_path,
+    model_path,
+    N=10,
+    n_probe=None,
+    aggregation="top_k_mean",
+    top_k=5,
+    cache=None,
+):
+    """
+        Returns the top N papers of an archive for a user library,
+        using a vector index built with build_index
+
+        Arguments:
+            user_data_filepath: str, Path. Path to user's library file
+            index_path: str, Path. Path to the saved index
+            model_path: str, Path. Path to the TF-IDF model used to build it
+            N: int. Number of papers to return
+            n_probe: int. Number of lists of the index to score
+            aggregation: str. How to aggregate the similarity to
+                all user papers (see refy.similarity). The index finds the
+                papers most similar to some user papers, so its recall is
+                low with 'median' (see benchmarks/index.py)
+            top_k: int. Number of user papers used by 'top_k_mean'
+            cache: refy.cache.LibraryCache. Optional cache of parsed entries
+
+        Returns:
+            papers: pd.DataFrame with the 'id' and 'score' of the top N papers
+    """
+    from refy.infer import TfidfModel  # slow to import
+
+    if not Path(model_path).exists():
+        raise FileNotFoundError(f"TF-IDF model not found: {model_path}")
+    index = VectorIndex.load(index_path)
+    model = TfidfModel.load(model_path)
+    if _model_version(model) != index.model_version:
+        raise ValueError(
+            "The TF-IDF model changed since the index was built, "
+            "build the index again"
+        )
+
+    user_papers = load_user_input(user_data_filepath, cache=cache)
+    user_vectors = model.transform(list(user_papers["abstract"]))
+
+    IDs, scores = index.search(
+        user_vectors,
+        N=N,
+        n_probe=n_probe,
+        aggregation=aggregation,
+        top_k=top_k,
+    )
+    return pd.DataFrame(dict(id=IDs, score=scores))
@@ -1,10 +1,449 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import (
+    TfidfVectorizer,
+    CountVectorizer,
+    HashingVectorizer,
+)
+from sklearn.preprocessing import normalize
+from scipy import sparse
+import numpy as np
+import os
+import pickle
+from pathlib import Path
+from datetime import datetime, timedelta
 from loguru import logger
 
+from refy.utils import text_hash
 
-def fit_tfidf(preprints_abstracts, user_abstracts):
+# pre-processing settings shared by all TF-IDF models
+tfidf_settings = dict(strip_accents="ascii", stop_words="english")
+
+
+class TfidfVectors:
+    def __init__(self, matrix, IDs, terms=None, idf=None):
+        """
+            Stores the TF-IDF vectors of a set of documents as a sparse
+            CSR matrix together with an index mapping each document's ID
+            to its row, so that vectors never need to be densified.
+
+            Arguments:
+                matrix: scipy.sparse matrix with one row per document
+                IDs: list of str with the ID of each row's document
+                terms: np.ndarray with the term of each column, None
+                    if terms are hashed
+                idf: np.ndarray with the IDF weight of each column, used
+                    to vectorize new documents with transform
+        """
+        self.matrix = matrix.tocsr()
+        self.IDs = list(IDs)
+        self.index = {ID: n for n, ID in enumerate(self.IDs)}
+        self.terms = terms
+        self.idf = idf
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __contains__(self, ID):
+        return ID in self.index
+
+    def __getitem__(self, ID):
+        """
+            Returns the vector of a single document as a 1 x n_terms
+            sparse matrix
+        """
+        row = self.index[ID]
+        return self.matrix[row : row + 1]
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def rows(self, IDs):
+        """
+            Returns the vectors of a set of documents as a sparse matrix
+
+            Arguments:
+                IDs: iterable of str with documents IDs
+
+            Returns:
+                vectors: scipy.sparse.csr_matrix with one row per ID
+        """
+        return self.matrix[[self.index[ID] for ID in IDs]]
+
+    def transform(self, texts):
+        """
+            Returns the TF-IDF vectors of a list of documents in the same
+            space as the stored vectors, e.g. to score a user library
+            against vectors loaded in a worker without loading the model.
+            Terms that are not in the stored vocabulary are ignored.
+
+            Arguments:
+                texts: list of str
+
+            Returns:
+                vectors: scipy.sparse.csr_matrix with one row per text
+        """
+        if self.idf is None:
+            raise ValueError(
+                "Cannot vectorize new documents without the IDF weights"
+            )
+
+        if self.terms is None:
+            vectorizer = HashingVectorizer(
+                n_features=self.matrix.shape[1],
+                alternate_sign=False,
+                norm=None,
+                **tfidf_settings,
+            )
+        else:
+            vectorizer = CountVectorizer(
+                vocabulary={term: n for n, term in enumerate(self.terms)},
+                dtype=np.float64,
+                **tfidf_settings,
+            )
+        counts = vectorizer.transform(list(texts))
+        return normalize(counts @ sparse.diags(self.idf))
+
+    def save(self, folder):
+        """
+            Saves the vectors to a folder as uncompressed .npy files (the CSR
+            data, indices and indptr arrays, IDs, terms and IDF) that any number
+            of processes can open as memory-mapped arrays, see load.
+            Each file is written to a temporary file first and then replaces
+            the old one, so processes that already opened the previous
+            vectors keep reading them.
+
+            Arguments:
+                folder: str, Path. Path to the folder
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        # read-only matrices can't be sorted in place after loading
+        matrix = self.matrix
+        if not matrix.has_canonical_format:
+            matrix = matrix.copy()
+            matrix.sum_duplicates()
+
+        arrays = dict(
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            shape=np.array(matrix.shape),
+            IDs=np.array(self.IDs, dtype=str),
+        )
+        if self.terms is not None:
+            arrays["terms"] = np.asarray(self.terms, dtype=str)
+        if self.idf is not None:
+            arrays["idf"] = np.asarray(self.idf, dtype=np.float64)
+
+        for name, array in arrays.items():
+            temp = folder / f"{name}.tmp.npy"
+            np.save(temp, array)
+            os.replace(temp, folder / f"{name}.npy")
+        logger.debug(f"Saved {len(self)} TF-IDF vectors to: {folder}")
+
+    @classmethod
+    def load(cls, folder, mmap=True):
+        """
+            Loads vectors saved with TfidfVectors.save
+
+            Arguments:
+                folder: str, Path. Path to the folder
+                mmap: bool. If true the sparse matrix arrays are memory-mapped
+                    read-only instead of being read into memory, so that
+                    processes using the same vectors share them
+
+            Returns:
+                vectors: TfidfVectors
+        """
+        folder = Path(folder)
+        mmap_mode = "r" if mmap else None
+
+        def load_array(name):
+            return np.load(folder / f"{name}.npy", mmap_mode=mmap_mode)
+
+        matrix = sparse.csr_matrix(
+            (load_array("data"), load_array("indices"), load_array("indptr")),
+            shape=tuple(np.load(folder / "shape.npy")),
+            copy=False,
+        )
+        matrix.has_canonical_format = True  # ensured by save
+
+        def load_optional(name):
+            path = folder / f"{name}.npy"
+            return np.load(path) if path.exists() else None
+
+        IDs = np.load(folder / "IDs.npy").tolist()
+        logger.debug(f"Loaded {len(IDs)} TF-IDF vectors from: {folder}")
+        return cls(
+            matrix,
+            IDs,
+            terms=load_optional("terms"),
+            idf=load_optional("idf"),
+        )
+
+
+class TfidfModel:
+    def __init__(
+        self,
+        hashing=False,
+        n_features=2 ** 20,
+        refit_every=7,
+        update_idf=True,
+    ):
+        """
+            A TF-IDF model that can be saved to file and updated with new
+            documents across runs. It stores the vocabulary, the document
+            frequency of each term and the term counts of all documents
+            it has seen, so that a document's text is only vectorized once.
+            IDF weights are recomputed from the stored counts, and the whole
+            model is fitted again from scratch every few days.
+
+            Arguments:
+                hashing: bool. If true terms are mapped to columns with
+                    the hashing trick and no vocabulary is needed
+                n_features: int. Number of columns when hashing=True
+                refit_every: int. Number of days after which the model
+                    should be fitted again from scratch
+                update_idf: bool. If false new documents are vectorized
+                    with the current vocabulary and IDF weights, which
+                    then only change when the model is fitted again
+        """
+        self.hashing = hashing
+        self.n_features = n_features
+        self.refit_every = refit_every
+        self.update_idf = update_idf
+
+        self.vocabulary = None if hashing else {}
+        self.df = np.zeros(n_features if hashing else 0, dtype=np.int64)
+        self.n_docs = 0
+        self.fitted_at = None
+        self.version = 0
+
+        # term counts of each document, indexed by a hash of its text
+        self.counts = sparse.csr_matrix((0, len(self.df)), dtype=np.float64)
+        self.index = {}
+
+    def __len__(self):
+        return self.n_docs
+
+    @property
+    def needs_refit(self):
+        """
+            True if the model was never fitted or was fitted
+            more than refit_every days ago
+        """
+        if self.fitted_at is None:
+            return True
+        return datetime.now() - self.fitted_at > timedelta(self.refit_every)
+
+    @property
+    def terms(self):
+        """
+            The term of each column, None if terms are hashed
+        """
+        if self.hashing:
+            return None
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        for term, column in self.vocabulary.items():
+            terms[column] = term
+        return terms
+
+    @property
+    def idf(self):
+        """
+            Smoothed inverse document frequency of each term,
+            computed like sklearn's TfidfTransformer
+        """
+        return np.log((1 + self.n_docs) / (1 + self.df)) + 1
+
+    def _count(self, texts, grow=True):
+        """
+            Counts the terms in a list of texts, adding
+            new terms to the vocabulary when they're allowed
+
+            Arguments:
+                texts: list of str
+                grow: bool. If false the vocabulary is never changed
+
+            Returns:
+                counts: scipy.sparse.csr_matrix with one row per text
+        """
+        if self.hashing:
+            return HashingVectorizer(
+                n_features=self.n_features,
+                alternate_sign=False,
+                norm=None,
+                **tfidf_settings,
+            ).transform(texts)
+
+        analyzer = TfidfVectorizer(**tfidf_settings).build_analyzer()
+        grow = grow and (self.update_idf or not self.vocabulary)
+        indices, indptr = [], [0]
+        for text in texts:
+            for term in analyzer(text):
+                column = self.vocabulary.get(term)
+                if column is None and grow:
+                    column = self.vocabulary[term] = len(self.vocabulary)
+                if column is not None:
+                    indices.append(column)
+            indptr.append(len(indices))
+
+        counts = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(texts), len(self.vocabulary)),
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def _add(self, keys, counts):
+        """
+            Stores the term counts of new documents
+        """
+        n_terms = counts.shape[1]
+        if n_terms > len(self.df):
+            self.df = np.concatenate(
+                [self.df, np.zeros(n_terms - len(self.df), dtype=np.int64)]
+            )
+            self.counts.resize((self.counts.shape[0], n_terms))
+
+        for key in keys:
+            self.index[key] = len(self.index)
+        self.counts = sparse.vstack([self.counts, counts], format="csr")
+
+    def fit(self, texts):
+        """
+            Fits the model from scratch on a corpus of documents,
+            discarding the vocabulary and stored counts
+
+            Arguments:
+                texts: list of str
+        """
+        logger.debug(f"Fitting TF-IDF model on {len(texts)} documents")
+        keys = {text_hash(text): text for text in texts}
+
+        if not self.hashing:
+            self.vocabulary = {}
+        self.df = np.zeros(self.n_features if self.hashing else 0, np.int64)
+        self.counts = sparse.csr_matrix((0, len(self.df)), dtype=np.float64)
+        self.index = {}
+
+        counts = self._count(list(keys.values()))
+        self._add(keys.keys(), counts)
+        self.df += np.bincount(counts.indices, minlength=len(self.df))
+        self.n_docs = len(keys)
+
+        self.fitted_at = datetime.now()
+        self.version += 1
+
+    def update(self, texts):
+        """
+            Updates the model with a batch of documents: only documents
+            that were never seen before are vectorized and, if update_idf
+            is true, they're used to update the terms' document frequency.
+
+            Arguments:
+                texts: list of str
+        """
+        new = {
+            text_hash(text): text
+            for text in texts
+            if text_hash(text) not in self.index
+        }
+        if not new:
+            return
+        logger.debug(f"Updating TF-IDF model with {len(new)} new documents")
+
+        counts = self._count(list(new.values()))
+        self._add(new.keys(), counts)
+
+        if self.update_idf:
+            self.df += np.bincount(counts.indices, minlength=len(self.df))
+            self.n_docs += len(new)
+            self.version += 1
+
+    def transform(self, texts):
+        """
+            Returns the TF-IDF vectors of a list of documents. Documents
+            that were not added to the model are vectorized on the fly
+            with the current vocabulary, without changing the model.
+
+            Arguments:
+                texts: list of str
+
+            Returns:
+                vectors: scipy.sparse.csr_matrix with one row per text
+        """
+        hashes = [text_hash(text) for text in texts]
+        known = np.array([h in self.index for h in hashes], dtype=bool)
+        rows = [self.index[h] for h in hashes if h in self.index]
+        counts = self.counts[rows]
+
+        if not known.all():
+            unseen = [text for text, k in zip(texts, known) if not k]
+            counts = sparse.vstack(
+                [counts, self._count(unseen, grow=False)], format="csr"
+            )
+
+            # put rows back in the same order as the texts
+            order = np.argsort(~known, kind="stable")
+            counts = counts[np.argsort(order)]
+
+        vectors = counts @ sparse.diags(self.idf)
+        return normalize(vectors)
+
+    def save(self, path):
+        """
+            Saves the model to a file
+
+            Arguments:
+                path: str, Path. Path to the file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fl:
+            pickle.dump(self.__dict__, fl)
+        logger.debug(f"Saved TF-IDF model to: {path}")
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+            Loads a model from file, or creates a new
+            model if the file doesn't exist
+
+            Arguments:
+                path: str, Path. Path to the file
+                kwargs: used to create a new model. refit_every and update_idf,
+                    which don't change the saved vectors, also replace
+                    the settings of a loaded model
+        """
+        model = cls(**kwargs)
+        if Path(path).exists():
+            with open(path, "rb") as fl:
+                model.__dict__.update(pickle.load(fl))
+            model.__dict__.update(
+                {
+                    key: value
+                    for key, value in kwargs.items()
+                    if key in ("refit_every", "update_idf")
+                }
+            )
+            logger.debug(
+                f"Loaded TF-IDF model from: {path} | {len(model)} documents"
+            )
+        return model
+
+
+def fit_tfidf(preprints_abstracts, user_abstracts, model=None):
     """
-        Fits tf-idf to all data and estimates cosine similarity
+        Fits tf-idf to all data and returns the sparse vectors
+        of all preprints and user papers
+
+        Arguments:
+            preprints_abstracts, user_abstracts: dict of ID: abstract
+            model: TfidfModel. Optional persistent model, if passed
+                it's updated with the new abstracts (or fitted again
+                if it's too old) instead of fitting a new model.
     """
     logger.debug("Fitting TF-IDF model")
 
@@ -14,11 +453,29 @@ def fit_tfidf(preprints_abstracts, user_abstracts):
         user_abstracts.values()
     )
 
-    # create TF-IDF model
-    model = TfidfVectorizer(strip_accents="ascii", stop_words="english")
+    if model is None:
+        # create TF-IDF model
+        model = TfidfVectorizer(**tfidf_settings)
 
-    # fit (includes pre processing)
-    model.fit(abstracts)
-    vectors = model.transform(abstracts).toarray()
+        # fit and transform (includes pre processing)
+        vectors = model.fit_transform(abstracts)
+        try:
+            terms = model.get_feature_names_out()
+        except AttributeError:  # older versions of sklearn
+            terms = model.get_feature_names()
+        terms = np.array(terms, dtype=object)
+        idf = model.idf_
+    else:
+        if model.needs_refit:
+            model.fit(abstracts)
+        else:
+            model.update(abstracts)
+        vectors = model.transform(abstracts)
+        terms = model.terms
+        idf = model.idf
+
+    logger.debug(
+        f"TF-IDF vectors: {vectors.shape[0]} documents x {vectors.shape[1]} terms | {vectors.nnz} non zero entries"
+    )
 
-    return {k: v for k, v in zip(IDs, vectors)}
+    return TfidfVectors(vectors, IDs, terms=terms, idf=idf)
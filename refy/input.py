@@ -1,52 +1,598 @@
-from bibtexparser.bparser import BibTexParser
 from pathlib import Path
+from time import perf_counter
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
 import pandas as pd
+import re
 from loguru import logger
 
+from refy.utils import text_hash
 
-def load_from_bib(fpath):
+# match the type of a bibtex entry, e.g. in '@article{key,'
+bib_type = re.compile(r"@\s*(\w*)")
+
+# pieces of a bibtex entry
+bib_start = re.compile(r"\s*@\s*(\w+)\s*[{(]")
+bib_field = re.compile(r"[\s,]*([^\s=,{}()\"#]+)\s*=\s*")
+bib_word = re.compile(r"[^\s,#})]+")
+bib_braces = re.compile(r"[{}]")
+bib_quotes = re.compile(r'[{}"]')
+bib_newline = re.compile(r"\n\s*")
+
+# fields of bibtex entries used by refy
+bib_fields = ("title", "journal", "author", "abstract")
+
+# @string definitions available in all .bib files
+common_strings = dict(
+    jan="January",
+    feb="February",
+    mar="March",
+    apr="April",
+    may="May",
+    jun="June",
+    jul="July",
+    aug="August",
+    sep="September",
+    oct="October",
+    nov="November",
+    dec="December",
+)
+
+# max number of new entries parsed before looking them up in the cache
+cache_batch_size = 256
+
+# functions loading user libraries, by file suffix. See register_loader
+loaders = {}
+
+
+def register_loader(*suffixes):
     """
-        Reads from a .bib file and returns a dictionary
-        with entries
+        Decorator registering a function that loads user libraries from files
+        with the given suffixes. Loaders are called with the path to a file and
+        an optional refy.cache.LibraryCache, and return a dict of ID: entry
+        where each entry is a dict with bibtex-like fields ('title', 'journal',
+        'author' with names separated by ' and ', 'abstract').
+
+        Arguments:
+            suffixes: str. File suffixes, e.g. '.bib'
+    """
+
+    def register(loader):
+        for suffix in suffixes:
+            loaders[suffix.lower()] = loader
+        return loader
+
+    return register
+
+
+def _raw_bib_entries(lines):
+    """
+        Yields the raw text of each bibtex entry from an iterable of lines,
+        keeping only one entry in memory. A new entry starts at each line
+        beginning with '@' outside of braces, so that lines of a value
+        starting with '@' stay in their entry
+    """
+    entry, depth = [], 0
+    for line in lines:
+        if depth == 0 and line.lstrip().startswith("@"):
+            if entry:
+                yield "".join(entry)
+            entry = [line]
+        elif entry:
+            entry.append(line)
+        else:
+            continue
+        depth = max(depth + line.count("{") - line.count("}"), 0)
+    if entry:
+        yield "".join(entry)
+
+
+def _read_delimited(text, pos, delimiters):
+    """
+        Reads a value delimited by braces or quotes starting at pos,
+        where text[pos] is the opening delimiter. Braces inside the value
+        must be balanced.
+
+        Returns:
+            value: str, the value without delimiters
+            end: int, position after the closing delimiter
+    """
+    depth = 0
+    for match in delimiters.finditer(text, pos + 1):
+        char = match.group()
+        if char == "{":
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+        elif depth == 0:
+            return text[pos + 1 : match.start()], match.end()
+    raise ValueError("Unbalanced braces in bibtex entry")
+
+
+def _parse_bib_fields(text, pos, strings):
+    """
+        Parses the 'name = value' fields of a bibtex entry starting at pos.
+        Values can be in braces or quotes, be numbers or @string
+        names, and be concatenated with '#'.
+
+        Returns:
+            fields: dict of name: value, with lower case names
+    """
+    fields = {}
+    while True:
+        match = bib_field.match(text, pos)
+        if match is None:
+            return fields
+        name, pos = match.group(1).lower(), match.end()
+
+        parts = []
+        while pos < len(text):
+            if text[pos] == "{":
+                value, pos = _read_delimited(text, pos, bib_braces)
+            elif text[pos] == '"':
+                value, pos = _read_delimited(text, pos, bib_quotes)
+            else:
+                word = bib_word.match(text, pos)
+                if word is None:
+                    break
+                value = strings.get(word.group().lower(), word.group())
+                pos = word.end()
+            parts.append(value)
+
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+            if pos < len(text) and text[pos] == "#":
+                pos += 1
+                while pos < len(text) and text[pos].isspace():
+                    pos += 1
+            else:
+                break
+        fields[name] = bib_newline.sub("\n", "".join(parts))
+
+
+def parse_bib_entry(raw, strings=None, fields=bib_fields):
+    """
+        Parses the raw text of a single bibtex entry. @string
+        definitions are added to strings instead.
+
+        Arguments:
+            raw: str with the entry's text
+            strings: dict of name: value of @string definitions. Optional,
+                common strings (months names) are always available
+            fields: tuple of str with the fields to keep, None to keep all
+
+        Returns:
+            entry: dict with the entry's 'ID', 'ENTRYTYPE' and fields,
+                None for @string, @comment and @preamble or invalid entries
     """
-    parser = BibTexParser(common_strings=True)
+    try:
+        return _parse_bib_entry(raw, strings, fields)
+    except ValueError as error:
+        logger.warning(
+            f"Skipping invalid bibtex entry {raw.strip().splitlines()[0]} "
+            f"| {error}"
+        )
+        return None
+
+
+def _parse_bib_entry(raw, strings, fields):
+    """
+        Parses a bibtex entry, see parse_bib_entry.
+        Raises a ValueError if the entry is not valid
+    """
+    strings = common_strings if strings is None else strings
+    start = bib_start.match(raw)
+    if start is None:
+        return None
+    entry_type, pos = start.group(1).lower(), start.end()
+
+    if entry_type == "string":
+        strings.update(_parse_bib_fields(raw, pos, strings))
+        return None
+    elif entry_type in ("comment", "preamble"):
+        return None
+
+    key_end = raw.find(",", pos)
+    if key_end < 0:
+        return None
+    values = _parse_bib_fields(raw, key_end + 1, strings)
+
+    entry = dict(ENTRYTYPE=entry_type, ID=raw[pos:key_end].strip())
+    if fields is None:
+        entry.update(values)
+    else:
+        entry.update({f: values[f] for f in fields if f in values})
+    return entry
+
+
+def _entry_type(raw):
+    """
+        Returns the lower case type of a raw bibtex entry
+    """
+    return bib_type.match(raw.lstrip()).group(1).lower()
+
+
+def _has_abstract(raw):
+    """
+        Quickly checks if the raw text of an entry can have an
+        abstract, before parsing it
+    """
+    return "abstract" in raw.lower()
+
 
+def iter_bib_entries(fpath):
+    """
+        Reads a .bib file entry by entry, yielding only entries that have an
+        abstract and only the fields used by refy. Memory use is bounded
+        by the size of the largest entry.
+
+        Arguments:
+            fpath: str, Path. Path to a .bib file
+
+        Yields:
+            entry: dict with the entry's 'ID', 'ENTRYTYPE' and fields
+    """
+    start, n_entries, n_parsed = perf_counter(), 0, 0
+    strings = dict(common_strings)
     with open(fpath, encoding="utf-8") as bibtex_file:
-        bib_database = parser.parse_file(bibtex_file)
+        for raw in _raw_bib_entries(bibtex_file):
+            n_entries += 1
+            if _entry_type(raw) != "string" and not _has_abstract(raw):
+                continue
+
+            entry = parse_bib_entry(raw, strings)
+            if entry is not None and entry.get("abstract"):
+                n_parsed += 1
+                yield entry
 
-    return bib_database.entries_dict
+    elapsed = perf_counter() - start
+    size = Path(fpath).stat().st_size / 1e6
+    logger.debug(
+        f"Parsed {n_parsed}/{n_entries} entries with abstract from "
+        f"{size:.1f} MB in {elapsed:.2f}s | {size / elapsed:.1f} MB/s"
+    )
 
 
-def load_user_input(fpath):
+def _file_hash(fpath):
     """
-        Parse an input library to extract authors and topics.
-        From the path to a bib file extract a dictionary of bib-like entries
-        and create a dataframe from these
+        Returns the same hash as refy.utils.text_hash for
+        the content of a file, reading it line by line
+    """
+    file_hash = hashlib.sha1()
+    with open(fpath, encoding="utf-8") as bibtex_file:
+        for line in bibtex_file:
+            file_hash.update(line.encode("utf-8"))
+    return file_hash.hexdigest()
+
+
+def _load_from_bib_cached(fpath, cache):
+    """
+        Parses a .bib file re-using cached entries.
+        If the whole file was seen before no entry is parsed, otherwise
+        only entries whose text changed are parsed and added to the cache.
+
+        Arguments:
+            fpath: str, Path. Path to a .bib file
+            cache: refy.cache.LibraryCache
+
+        Returns:
+            entries: dict of ID: entry
+    """
+    file_hash = _file_hash(fpath)
+    hashes = cache.get_file(file_hash)
+    if hashes is not None:
+        entries = cache.get_entries(hashes)
+        if len(entries) == len(set(hashes)):
+            logger.debug("Loaded user library from cache")
+            return {entries[h]["ID"]: entries[h] for h in hashes}
+
+    # entries are hashed with the @string definitions preceding them
+    strings, definitions = dict(common_strings), ""
+    hashes, entries, batch = [], {}, {}
+
+    def parse_batch():
+        if not batch:
+            return 0
+        cached = cache.get_entries(list(batch))
+        new = {
+            h: parse_bib_entry(r, strings)
+            for h, r in batch.items()
+            if h not in cached
+        }
+        new = {h: e for h, e in new.items() if e and e.get("abstract")}
+        cache.put_entries(new)
+        entries.update(cached)
+        entries.update(new)
+        batch.clear()
+        return len(new)
+
+    n_new = 0
+    with open(fpath, encoding="utf-8") as bibtex_file:
+        for raw in _raw_bib_entries(bibtex_file):
+            if _entry_type(raw) == "string":
+                # pending entries use the previous definitions
+                n_new += parse_batch()
+                parse_bib_entry(raw, strings)
+                definitions += raw
+            elif _has_abstract(raw):
+                h = text_hash(definitions + raw)
+                hashes.append(h)
+                batch[h] = raw
+                if len(batch) >= cache_batch_size:
+                    n_new += parse_batch()
+    n_new += parse_batch()
+    logger.debug(
+        f"Parsed {n_new}/{len(hashes)} new or modified library entries"
+    )
+
+    hashes = [h for h in hashes if h in entries]
+    cache.put_file(file_hash, hashes)
+    return {entries[h]["ID"]: entries[h] for h in hashes}
+
+
+@register_loader(".bib")
+def load_from_bib(fpath, cache=None):
+    """
+        Reads from a .bib file and returns a dictionary
+        with entries that have an abstract
 
         Arguments:
             fpath: str, Path. Path to a .bib file
+            cache: refy.cache.LibraryCache. Optional, if passed parsed
+                entries are cached and unchanged entries aren't parsed again
+    """
+    if cache is not None:
+        return _load_from_bib_cached(fpath, cache)
+    return {entry["ID"]: entry for entry in iter_bib_entries(fpath)}
+
+
+# ------------------------------------ RIS ----------------------------------- #
+# RIS tags of the fields used by refy
+ris_tags = dict(
+    TI="title",
+    T1="title",
+    JO="journal",
+    JF="journal",
+    T2="journal",
+    AU="author",
+    A1="author",
+    AB="abstract",
+    N2="abstract",
+    ID="ID",
+    TY="ENTRYTYPE",
+)
+ris_line = re.compile(r"^([A-Z][A-Z0-9])  -( (.*))?$")
+
+
+def iter_ris_entries(fpath):
+    """
+        Reads a .ris file line by line, yielding one entry at a time
+
+        Arguments:
+            fpath: str, Path. Path to a .ris file
+
+        Yields:
+            entry: dict with bibtex-like fields
+    """
+    entry, field = {}, None
+    with open(fpath, encoding="utf-8-sig") as ris_file:
+        for line in ris_file:
+            line = line.rstrip("\r\n")
+            match = ris_line.match(line)
+            if match is None:  # continuation of the previous field
+                if field is not None and line.strip():
+                    entry[field] += " " + line.strip()
+                continue
+
+            tag, value = match.group(1), (match.group(3) or "").strip()
+            if tag == "ER":
+                if entry:
+                    yield entry
+                entry, field = {}, None
+                continue
+
+            field = ris_tags.get(tag)
+            if field == "author" and "author" in entry:
+                entry["author"] += " and " + value
+            elif field is not None and field not in entry:
+                entry[field] = value
+            else:
+                field = None
+    if entry:
+        yield entry
+
+
+@register_loader(".ris")
+def load_from_ris(fpath, cache=None):
+    """
+        Reads from a .ris file and returns a dictionary with entries
+
+        Arguments:
+            fpath: str, Path. Path to a .ris file
+            cache: not used
+    """
+    entries = {}
+    for n, entry in enumerate(iter_ris_entries(fpath)):
+        entry.setdefault("ID", f"ris{n}")
+        entries[entry["ID"]] = entry
+    return entries
+
+
+# --------------------------------- CSL JSON --------------------------------- #
+def iter_json_items(fpath, chunk_size=2 ** 16):
+    """
+        Reads the objects in a JSON array one at a time, so that memory use
+        is bounded by the size of the largest object.
+
+        Arguments:
+            fpath: str, Path. Path to a .json file with an array of objects
+            chunk_size: int. Number of characters read at once
+
+        Yields:
+            item: dict
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    with open(fpath, encoding="utf-8-sig") as json_file:
+        while True:
+            # skip whitespace and the array's delimiters
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+                pos += 1
+
+            if pos < len(buffer):
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                    yield item
+                    continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                return
+
+            # the next item is incomplete, read more
+            chunk = json_file.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+
+
+def _csl_names(names):
+    """
+        Joins CSL-JSON names in a bibtex-like authors string
+    """
+    names = [
+        name.get("literal")
+        or ", ".join(
+            n for n in (name.get("family"), name.get("given")) if n
+        )
+        for name in names or []
+        if isinstance(name, dict)
+    ]
+    return " and ".join(n for n in names if n)
+
+
+@register_loader(".json")
+def load_from_csl_json(fpath, cache=None):
+    """
+        Reads from a CSL-JSON file (e.g. exported by Zotero or
+        Mendeley) and returns a dictionary with entries
+
+        Arguments:
+            fpath: str, Path. Path to a .json file
+            cache: not used
+    """
+    entries = {}
+    for n, item in enumerate(iter_json_items(fpath)):
+        if not isinstance(item, dict) or not item.get("abstract"):
+            continue
+        entry = dict(
+            ID=str(item.get("id", f"csl{n}")),
+            ENTRYTYPE=item.get("type"),
+            title=item.get("title"),
+            journal=item.get("container-title"),
+            author=_csl_names(item.get("author")),
+            abstract=item["abstract"],
+        )
+        entries[entry["ID"]] = entry
+    return entries
+
+
+# ------------------------------- Zotero SQLite ------------------------------ #
+# zotero fields used by refy
+zotero_fields = dict(
+    title="title", publicationTitle="journal", abstractNote="abstract"
+)
+
+
+@register_loader(".sqlite")
+def load_from_zotero(fpath, cache=None):
+    """
+        Reads the items of a Zotero database (zotero.sqlite in Zotero's
+        data directory) and returns a dictionary with entries.
+        Deleted items are ignored. Zotero locks its database while running,
+        a copy of the file can be used instead.
+
+        Arguments:
+            fpath: str, Path. Path to a zotero.sqlite file
+            cache: not used
+    """
+    uri = Path(fpath).resolve().as_uri() + "?mode=ro"
+    with closing(sqlite3.connect(uri, uri=True)) as db:
+        values = db.execute(
+            f"""
+            SELECT items.key, itemTypes.typeName, fieldsCombined.fieldName,
+                itemDataValues.value
+            FROM items
+            JOIN itemTypes USING (itemTypeID)
+            JOIN itemData USING (itemID)
+            JOIN fieldsCombined USING (fieldID)
+            JOIN itemDataValues USING (valueID)
+            WHERE fieldsCombined.fieldName IN
+                ({", ".join("?" * len(zotero_fields))})
+            AND items.itemID NOT IN (SELECT itemID FROM deletedItems)
+            """,
+            list(zotero_fields),
+        )
+        entries = {}
+        for key, item_type, field, value in values:
+            entry = entries.setdefault(key, dict(ID=key, ENTRYTYPE=item_type))
+            entry[zotero_fields[field]] = value
+
+        creators = db.execute(
+            """
+            SELECT items.key, creators.lastName, creators.firstName
+            FROM itemCreators
+            JOIN items USING (itemID)
+            JOIN creators USING (creatorID)
+            ORDER BY itemCreators.itemID, itemCreators.orderIndex
+            """
+        )
+        for key, last, first in creators:
+            if key not in entries:
+                continue
+            name = ", ".join(n for n in (last, first) if n)
+            if entries[key].get("author"):
+                entries[key]["author"] += " and " + name
+            else:
+                entries[key]["author"] = name
+
+    return {k: e for k, e in entries.items() if e.get("abstract")}
+
+
+def load_user_input(fpath, cache=None):
+    """
+        Parse an input library to extract authors and topics.
+        From the path to a library file extract a dictionary of bib-like
+        entries and create a dataframe from these. The file is read by
+        the loader registered for its suffix (see register_loader):
+        .bib, .ris, CSL-JSON (.json) and Zotero databases (.sqlite)
+        are supported.
+
+        Arguments:
+            fpath: str, Path. Path to a library file
+            cache: refy.cache.LibraryCache. Optional cache of parsed entries
     """
     # load from file
     fpath = Path(fpath)
-    if fpath.suffix == ".bib":
-        data = load_from_bib(fpath)
-    else:
+    loader = loaders.get(fpath.suffix.lower())
+    if loader is None:
         raise NotImplementedError(
             f"Cannot parse input with file type: {fpath.suffix}"
         )
+    data = loader(fpath, cache=cache)
     logger.debug(f"Loaded user input from file: {fpath} | {len(data)} entries")
 
     # Clean up data
-    data = pd.DataFrame(data.values())
-    data = data[["title", "journal", "author", "abstract"]]
+    data = pd.DataFrame(list(data.values()))
+    data = data.reindex(columns=list(bib_fields))
     data.columns = ["title", "journal", "authors", "abstract"]
     data["id"] = data["title"]
 
     # keep only papers with abstract
-    has_abs = [
-        True if (isinstance(a, str) and len(a) > 1) else False
-        for a in data["abstract"].values
-    ]
+    has_abs = data["abstract"].astype("string").str.len() > 1
+    has_abs = has_abs.fillna(False).astype(bool).values
 
     data = data[has_abs].reset_index()
 
@@ -1,5 +1,8 @@
-from gensim import summarization
 import pandas as pd
+import numpy as np
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from loguru import logger
 
 from rich.table import Table
@@ -8,24 +11,104 @@ from io import StringIO
 
 from myterial import pink, light_blue_light
 
+from refy.utils import text_hash
+from refy.similarity import top_n
+
+# methods to extract keywords from a library
+keywords_backends = ("textrank", "tfidf")
+
+
+def check_keywords_backend(backend, model=None):
+    """
+        Checks that keywords can be extracted with a backend, so
+        that invalid settings fail before preprints are downloaded
+
+        Arguments:
+            backend: str. One of keywords_backends
+            model: refy.infer.TfidfModel. Optional saved model
+                used to vectorize the papers
+    """
+    if backend not in keywords_backends:
+        raise ValueError(
+            f"Invalid keywords backend: {backend}, "
+            f"should be one of: {keywords_backends}"
+        )
+    if backend == "tfidf" and model is not None and model.hashing:
+        raise ValueError(
+            "Cannot extract keywords from a TF-IDF model with hashed terms, "
+            "use the 'textrank' keywords backend"
+        )
+
+
 # -------------------------------- Highlighter ------------------------------- #
 """
     A highlighter to highlight keywords in paper titles
 """
 
 
+def _trie_pattern(words):
+    """
+        Builds a regex pattern matching any of a list of words, with
+        words sharing a prefix merged into a trie so that the pattern
+        is matched in a single pass regardless of the number of words
+
+        Arguments:
+            words: list of str
+
+        Returns:
+            pattern: str
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # marks the end of a word
+
+    def to_pattern(node):
+        branches = [
+            re.escape(char) + to_pattern(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not branches:
+            return ""
+
+        pattern = "|".join(branches)
+        if len(branches) > 1 or "" in node:
+            pattern = f"(?:{pattern})"
+        if "" in node:
+            pattern += "?"
+        return pattern
+
+    return to_pattern(trie)
+
+
 class Highlighter:
     color = light_blue_light
 
     def __init__(self, words):
         """
-            Highlights pieces of text to mark keywords
+            Highlights pieces of text to mark keywords. All keywords are
+            compiled in a single case insensitive regex which only matches
+            whole words.
 
             Arguments:
                 words: list of str of words to mark
         """
         self.words = words
 
+        words = {word.strip().lower() for word in words if word.strip()}
+        if words:
+            self.regex = re.compile(
+                r"(?<!\w)" + _trie_pattern(words) + r"(?!\w)", re.IGNORECASE
+            )
+        else:
+            self.regex = None
+
+    def _mark(self, match):
+        return f"[{self.color}]{match.group(0)}[/{self.color}]"
+
     def __call__(self, text):
         """
             Highlights a piece of text
@@ -36,11 +119,9 @@ class Highlighter:
             Returns
                 text: highlighted string
         """
-        for word in self.words:
-            text = text.replace(
-                " " + word + " ", f"[{self.color}] {word} [/{self.color}]"
-            )
-        return text
+        if self.regex is None:
+            return text
+        return self.regex.sub(self._mark, text)
 
 
 # -------------------------------- get keyword ------------------------------- #
@@ -57,9 +138,157 @@ def get_keywords_from_text(text, N, **kwargs):
         Returns:
             keywords: list of str of keywords
     """
+    # gensim is slow to import, only load it when TextRank is used
+    from gensim import summarization
+
     return summarization.keywords(text, words=N, split=True, **kwargs)
 
 
+def _paper_keywords(abstract):
+    """
+        Extracts the keywords of a single paper of a library
+    """
+    return get_keywords_from_text(abstract, N=10)
+
+
+def _extract_keywords(abstracts, n_workers=1, chunk_size=None):
+    """
+        Extracts keywords from a list of abstracts in a pool of
+        processes, returning them in the same order as the abstracts
+
+        Arguments:
+            abstracts: list of str
+            n_workers: int. Number of processes, if 1 (or with few
+                abstracts) keywords are extracted in this process.
+                If None one process per CPU core is used
+            chunk_size: int. Number of abstracts sent to a process at once
+
+        Returns:
+            keywords: list of lists of str
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1 or len(abstracts) < 2 * n_workers:
+        return [_paper_keywords(abstract) for abstract in abstracts]
+
+    chunk_size = chunk_size or max(1, len(abstracts) // (4 * n_workers))
+    logger.debug(
+        f"Extracting keywords from {len(abstracts)} abstracts with {n_workers} processes"
+    )
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(
+            executor.map(_paper_keywords, abstracts, chunksize=chunk_size)
+        )
+
+
+def get_papers_keywords(abstracts, n_workers=1, cache=None):
+    """
+        Extracts the keywords of each paper, in parallel if n_workers
+        is not 1, and, if a cache is passed, only for abstracts
+        never seen before.
+
+        Arguments:
+            abstracts: list of str
+            n_workers: int. Number of processes used to extract keywords,
+                None for one per CPU core. On Windows and macOS processes
+                re-import the script that started them, so with more than one
+                process the script's code must be under
+                `if __name__ == "__main__":`
+            cache: refy.cache.KeywordsCache. Optional cache of each
+                abstract's keywords
+
+        Returns:
+            keywords: list of lists of str, one per abstract
+    """
+    hashes = [text_hash(abstract) for abstract in abstracts]
+
+    # get keywords for each paper
+    papers_keywords = cache.get(hashes) if cache is not None else {}
+    new = {
+        h: abstract
+        for h, abstract in zip(hashes, abstracts)
+        if h not in papers_keywords
+    }
+    if new:
+        new_keywords = dict(
+            zip(new.keys(), _extract_keywords(list(new.values()), n_workers))
+        )
+        if cache is not None:
+            cache.put(new_keywords)
+        papers_keywords.update(new_keywords)
+    return [papers_keywords[h] for h in hashes]
+
+
+def combine_keywords(papers_keywords):
+    """
+        Combines the keywords of each paper of a library
+        into the keywords of the whole library
+
+        Arguments:
+            papers_keywords: list of lists of str, one per paper
+
+        Returns:
+            keywords: Keywords
+    """
+    keywords = {}
+    for paper_keywords in papers_keywords:
+        for m, kw in enumerate(paper_keywords):
+            if kw in keywords.keys():
+                keywords[kw] += 10 - m
+            else:
+                keywords[kw] = 1
+
+    # sort keywords
+    return Keywords(keywords)
+
+
+def get_library_keywords(papers, n_workers=1, cache=None):
+    """
+        Extracts set of keywords that best represent a library of papers.
+        Keywords are extracted from each paper (see get_papers_keywords)
+        and then combined across papers.
+
+        Arguments:
+            papers: pd.DataFrame with papers metadata
+            n_workers: int. Number of processes used to extract keywords,
+                None for one per CPU core (see get_papers_keywords)
+            cache: refy.cache.KeywordsCache. Optional cache of each
+                abstract's keywords
+
+        Returns:
+            keywords: Keywords
+    """
+    return combine_keywords(
+        get_papers_keywords(list(papers.abstract), n_workers, cache=cache)
+    )
+
+
+def get_tfidf_keywords(embeddings, IDs, N=50):
+    """
+        Extracts set of keywords that best represent a library of papers
+        from an already fitted TF-IDF model: the keywords are the terms
+        with the largest total weight across the library's papers.
+
+        Arguments:
+            embeddings: refy.infer.TfidfVectors with the vectors of all papers
+            IDs: list of str with the IDs of the library's papers
+            N: int. Number of keywords to extract
+
+        Returns:
+            keywords: Keywords
+    """
+    if embeddings.terms is None:
+        raise ValueError(
+            "Cannot extract keywords from a TF-IDF model with hashed terms"
+        )
+
+    weights = np.asarray(embeddings.rows(IDs).sum(axis=0)).ravel()
+    best = top_n(weights, N)
+
+    return Keywords(
+        {embeddings.terms[n]: weights[n] for n in best if weights[n] > 0}
+    )
+
+
 # ---------------------------------------------------------------------------- #
 #                                   Keywords                                   #
 # ---------------------------------------------------------------------------- #
@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _rss():
+    """
+        Returns the current resident memory of the process in bytes,
+        or its peak resident memory where the current one isn't available,
+        or None if neither is available
+    """
+    try:
+        with open("/proc/self/statm") as fl:
+            return int(fl.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return _peak_rss()
+
+
+def _peak_rss():
+    """
+        Returns the peak resident memory of the process
+        in bytes, or None if it isn't available
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    def __init__(self, trace_memory=False):
+        """
+            Collects the wall time and memory use of the stages of a run.
+            For each stage it stores:
+                time: wall time in seconds
+                rss: resident memory at the end of the stage, in bytes
+                rss_change: change of resident memory during the stage
+                peak_rss: peak resident memory of the process so far
+                peak_traced: peak memory allocated by python during the stage,
+                    only if trace_memory is true
+            Resident memory is only stored where it can be measured
+            without extra dependencies (not on Windows).
+            Counts of items processed in the run (e.g. number of papers)
+            can be stored in Metrics.counts.
+
+            Arguments:
+                trace_memory: bool. If true python allocations are traced with
+                    tracemalloc, which slows down python code
+        """
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counts = {}
+        self.started_at = datetime.now()
+
+    def __getitem__(self, stage):
+        return self.stages[stage]
+
+    def __contains__(self, stage):
+        return stage in self.stages
+
+    @contextmanager
+    def stage(self, name):
+        """
+            Context manager measuring the code run inside it as a stage
+
+            Arguments:
+                name: str. Name of the stage
+        """
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+        # without reset_peak (python < 3.9) the peak of a stage can only
+        # be measured if tracing starts with the stage
+        trace = tracing or hasattr(tracemalloc, "reset_peak")
+        if self.trace_memory and trace:
+            traced = tracemalloc.get_traced_memory()[0]
+
+        rss = _rss()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            metrics = dict(time=perf_counter() - start)
+            if rss is not None:
+                metrics["rss"] = _rss()
+                metrics["rss_change"] = metrics["rss"] - rss
+                metrics["peak_rss"] = _peak_rss()
+            if self.trace_memory and trace:
+                metrics["peak_traced"] = (
+                    tracemalloc.get_traced_memory()[1] - traced
+                )
+            if tracing:
+                tracemalloc.stop()
+
+            self.stages[name] = metrics
+            memory = (
+                f" | RSS: {metrics['rss'] / 1e6:.1f} MB "
+                f"({metrics['rss_change'] / 1e6:+.1f} MB)"
+                if "rss" in metrics
+                else ""
+            )
+            logger.debug(f"Stage {name} took {metrics['time']:.3f}s{memory}")
+
+    def to_dict(self, **labels):
+        """
+            Returns the metrics of all stages as a dict
+
+            Arguments:
+                labels: added to the dict, e.g. to identify the run
+        """
+        return dict(
+            started_at=self.started_at.isoformat(),
+            **labels,
+            counts=self.counts,
+            stages=self.stages,
+        )
+
+    def to_jsonl(self, path, **labels):
+        """
+            Appends the metrics as a line to a JSON lines file
+
+            Arguments:
+                path: str, Path. Path to the .jsonl file
+                labels: added to the line, e.g. to identify the run
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as fl:
+            fl.write(json.dumps(self.to_dict(**labels)) + "\n")
+        logger.debug(f"Saved metrics to: {path}")
+
+    def to_prometheus(self, path, **labels):
+        """
+            Writes the metrics to a file in Prometheus' text format, e.g. to
+            be read by node exporter's textfile collector. The file is replaced
+            at once, so it's never read half written.
+
+            Arguments:
+                path: str, Path. Path to the .prom file
+                labels: added as labels to all metrics
+        """
+        descriptions = dict(
+            time=("seconds", "Wall time of each refy stage"),
+            rss=("rss_bytes", "Resident memory at the end of each stage"),
+            rss_change=("rss_change_bytes", "Change of resident memory"),
+            peak_rss=("peak_rss_bytes", "Peak resident memory of the process"),
+            peak_traced=("peak_traced_bytes", "Peak memory allocated"),
+        )
+
+        def format_labels(**extra):
+            pairs = dict(labels, **extra).items()
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        for item, count in self.counts.items():
+            name = f"refy_{item}_count"
+            lines += [
+                f"# HELP {name} Number of {item.replace('_', ' ')}",
+                f"# TYPE {name} gauge",
+                f"{name}{format_labels()} {count}",
+            ]
+
+        for metric, (suffix, description) in descriptions.items():
+            values = {
+                stage: metrics[metric]
+                for stage, metrics in self.stages.items()
+                if metric in metrics
+            }
+            if not values:
+                continue
+
+            name = f"refy_stage_{suffix}"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+            for stage, value in values.items():
+                lines.append(f"{name}{format_labels(stage=stage)} {value}")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(path.name + ".tmp")
+        temp.write_text("\n".join(lines) + "\n")
+        os.replace(temp, path)
+        logger.debug(f"Saved metrics to: {path}")
+
+    def save(self, path, **labels):
+        """
+            Saves the metrics in Prometheus' text format if
+            the path ends with .prom, as JSON lines otherwise
+
+            Arguments:
+                path: str, Path. Path to the file
+                labels: identify the run
+        """
+        if Path(path).suffix == ".prom":
+            self.to_prometheus(path, **labels)
+        else:
+            self.to_jsonl(path, **labels)
@@ -1,18 +1,30 @@
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import datetime
+from time import perf_counter
 from loguru import logger
 from pathlib import Path
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 from myterial import orange, green
 
-from refy.download import download_arxiv, download_biorxiv
-from refy.utils import date_to_string, open_in_browser
+from refy.download import fetch_preprints
+from refy.cache import (
+    PreprintsCache,
+    LibraryCache,
+    KeywordsCache,
+    ScoresCache,
+)
+from refy.utils import date_to_string, open_in_browser, text_hash
 from refy.results import Results
+from refy.metrics import Metrics
 from refy.input import load_user_input
-from refy.keywords import Keywords, get_keywords_from_text
-from refy.infer import fit_tfidf
+from refy.authors import top_authors
+from refy.store import PaperStore
+from refy.keywords import (
+    get_library_keywords,
+    get_tfidf_keywords,
+    check_keywords_backend,
+)
+from refy.similarity import compute_similarity, top_n
 
 
 class Recomender(Results):
@@ -23,66 +35,154 @@ class Recomender(Results):
         N=10,
         show_html=True,
         n_days=2,
+        aggregation="median",
+        top_k=5,
+        use_cache=True,
+        cache_path=None,
+        model_path=None,
+        update_idf=None,
+        refit_every=7,
+        n_workers=1,
+        keywords_backend="textrank",
+        trace_memory=False,
+        metrics_path=None,
     ):
         """
             Get arxiv & biorxiv preprints released in the last n days
             and select the top N matches based on user inputs
             
             Arguments:
-                user_data_filepath: str, Path. Path to user's .bib file
+                user_data_filepath: str, Path. Path to user's library file: .bib, .ris,
+                    CSL-JSON (.json) or Zotero database (.sqlite)
                 html_path: str, Path. Path to a .HTML to save formatted
                     results to.
                 N: int. Number of papers to return
                 show_html: bool. If true and a html_path is passed, it opens
                     the html in the default web browser
                 n_days: int. Default = 1. Number of days from preprints are to be taken (e.g. 7 means from the last week)
+                aggregation: str. How the similarity of a preprint to each user paper
+                    is combined into its score: 'median', 'mean', 'max' or 'top_k_mean'
+                top_k: int. Number of most similar user papers averaged when
+                    aggregation='top_k_mean'
+                use_cache: bool. If true preprints from previous days are loaded
+                    from a local cache and only new ones are downloaded. Parsed entries
+                    of the user library and their keywords are cached too, and so are
+                    the preprints scores when a model_path is given.
+                cache_path: str, Path. Optional path to the cache's .db file
+                model_path: str, Path. Optional path to a saved TF-IDF model. If passed
+                    the model is loaded (or created), updated with new abstracts only
+                    and saved back, instead of fitting a new model at every run.
+                    Cached scores are re-used until the model's version changes, i.e. until
+                    it's refitted or, if its IDF is updated (update_idf=True), until new
+                    documents are added to it.
+                update_idf: bool. If true new abstracts added to a saved model update its
+                    vocabulary and IDF weights, otherwise these only change when the model
+                    is refitted. By default the IDF is frozen when use_cache is true,
+                    so that cached scores are re-used across days.
+                refit_every: int. Number of days after which a saved model
+                    is fitted again from scratch
+                n_workers: int. Number of processes used to extract keywords
+                    from user papers, None for one per CPU core. On Windows and macOS
+                    with more than one process the code creating the Recomender must
+                    be under `if __name__ == "__main__":`
+                keywords_backend: str. How keywords are extracted from user papers:
+                    'textrank' runs TextRank on each abstract, 'tfidf' takes the terms
+                    with the largest weight in the already fitted TF-IDF model
+                trace_memory: bool. If true the peak memory allocated during each stage
+                    is measured with tracemalloc, which slows down python code.
+                    Wall time and resident memory of each stage are always stored
+                    in Recomender.metrics
+                metrics_path: str, Path. Optional path to a file the metrics of each stage
+                    are saved to: in Prometheus' text format if it ends with .prom,
+                    otherwise appended to a JSON lines file
         """
         if not Path(user_data_filepath).exists():
             raise FileExistsError(
-                f"bib file does not exist: {user_data_filepath}"
+                f"library file does not exist: {user_data_filepath}"
             )
+        self.model_path = model_path
+        self.update_idf = not use_cache if update_idf is None else update_idf
+        self.refit_every = refit_every
+
+        # load the saved model first, to check that it can be used
+        self.model = None
+        if model_path is not None:
+            from refy.infer import TfidfModel  # slow to import
+
+            self.model = TfidfModel.load(
+                model_path,
+                update_idf=self.update_idf,
+                refit_every=self.refit_every,
+            )
+        check_keywords_backend(keywords_backend, self.model)
+
         logger.debug("\n\nStarting biorxiv & arxiv daily search")
         self.n_days = n_days
         self.html_path = html_path
         self.N = N
+        self.aggregation = aggregation
+        self.top_k = top_k
+        self.cache = PreprintsCache(cache_path) if use_cache else None
+        self.library_cache = LibraryCache(cache_path) if use_cache else None
+        self.keywords_cache = KeywordsCache(cache_path) if use_cache else None
+        self.scores_cache = ScoresCache(cache_path) if use_cache else None
+        self.n_workers = n_workers
+        self.keywords_backend = keywords_backend
         self.results = Results()
         self.keywords = None
+        self.metrics = Metrics(trace_memory=trace_memory)
 
         # -- SETUPS
         # download preprints
         logger.debug("Downloading data from arxiv & biorxiv")
-        self.papers, self.abstracts = self.fetch_preprints()
+        with self.metrics.stage("fetch_preprints"):
+            self.store = PaperStore(*self.fetch_preprints())
+            self.authors_table = self.store.authors_table()
 
         # load user data
         logger.debug("Loading user papers")
-        self.user_papers = load_user_input(user_data_filepath)
-        self.user_abstracts = {
-            p["id"]: p.abstract for i, p in self.user_papers.iterrows()
-        }
+        with self.metrics.stage("load_user_input"):
+            self.user_papers = load_user_input(
+                user_data_filepath, cache=self.library_cache
+            )
+            self.user_abstracts = dict(
+                zip(self.user_papers["id"], self.user_papers["abstract"])
+            )
 
         logger.debug(
-            f"Final papers count: {len(self.papers)} preprints and {len(self.user_papers)} user papers"
+            f"Final papers count: {len(self.store)} preprints and {len(self.user_papers)} user papers"
         )
 
         # -- ANALYSIS
-        self.fit()
+        with self.metrics.stage("fit"):
+            self.fit()
 
         # get keyords
         logger.debug("Getting keywords")
-        self.get_keywords(self.user_papers)
+        with self.metrics.stage("get_keywords"):
+            self.get_keywords(self.user_papers)
 
         # -- RESULTS
         # print
         today = date_to_string(datetime.today())
-        self.results.print(
-            text=f"[{orange}]:calendar:  Daily suggestions for: [{green} bold]{today}\n\n"
-        )
+        with self.metrics.stage("print"):
+            self.results.print(
+                text=f"[{orange}]:calendar:  Daily suggestions for: [{green} bold]{today}\n\n"
+            )
 
         # save to html
-        self.results.to_html(
-            html_path,
-            text=f"[{orange}]:calendar:  Daily suggestions for: [{green} bold]{today}\n\n",
+        with self.metrics.stage("to_html"):
+            self.results.to_html(
+                html_path,
+                text=f"[{orange}]:calendar:  Daily suggestions for: [{green} bold]{today}\n\n",
+            )
+
+        # save metrics
+        self.metrics.counts.update(
+            preprints=len(self.store), user_papers=len(self.user_papers)
         )
+        if metrics_path is not None:
+            self.metrics.save(metrics_path)
 
         # open html in browser
         if self.html_path is not None and show_html:
@@ -91,53 +191,24 @@ class Recomender(Results):
     # ------------------------------ data extraction ----------------------------- #
     def fetch_preprints(self):
         """
-            Downloads preprints from the online databases
+            Downloads preprints from the online databases, using
+            the local cache for days that were already downloaded
         """
-        # get dates
-        today = date_to_string(datetime.today())
-        start_date = date_to_string(datetime.now() - timedelta(self.n_days))
-
-        # download
-        papers = pd.concat(
-            [
-                download_arxiv(today, start_date),
-                download_biorxiv(today, start_date),
-            ]
-        )
+        return fetch_preprints(self.n_days, cache=self.cache)
 
-        # cleanup
-        papers = papers[
-            [
-                "id",
-                "doi",
-                "title",
-                "authors",
-                "date",
-                "category",
-                "abstract",
-                "source",
-                "url",
-            ]
-        ]
-
-        # fix year of publication
-        papers["year"] = [
-            p.date.split("-")[0] if isinstance(p.date, str) else "2021"
-            for i, p in papers.iterrows()
-        ]
-        del papers["date"]
-
-        # separate abstracts
-        abstracts = {
-            paper.id: paper.abstract for i, paper in papers.iterrows()
-        }
-        del papers["abstract"]
-
-        # make sure everything checks out
-        papers = papers.loc[papers["id"].isin(abstracts.keys())]
-        papers = papers.drop_duplicates(subset="id")
-
-        return papers, abstracts
+    @property
+    def papers(self):
+        """
+            Dataframe with the metadata of all preprints, created from the store
+        """
+        return self.store.frame()
+
+    @property
+    def abstracts(self):
+        """
+            Dict-like view of all preprints' abstracts
+        """
+        return self.store.abstracts
 
     # ------------------------------- data analysis ------------------------------ #
     def fit(self):
@@ -145,29 +216,102 @@ class Recomender(Results):
             Fits tf-idf to data and estimates pairwise distance between all user
             and preprint papers, then selects best results
         """
-        embeddings = fit_tfidf(self.abstracts, self.user_abstracts)
+        # sklearn is slow to import, only load it when fitting
+        from refy.infer import fit_tfidf
+
+        model = self.model
+        if model is None:
+            embeddings = fit_tfidf(self.abstracts, self.user_abstracts)
+        else:
+            embeddings = fit_tfidf(
+                self.abstracts, self.user_abstracts, model=model
+            )
+            model.save(self.model_path)
+        self.embeddings = embeddings
 
-        # compute cosine distances (average across all input user papers)
+        # compute cosine similarity between all preprints and user papers
         logger.debug("Estimating distances")
-        distances = {ID: [] for ID in self.abstracts.keys()}
-        for uID in self.user_abstracts.keys():
-            for ID in self.abstracts.keys():
-                distances[ID].append(
-                    cosine_similarity(
-                        embeddings[uID].reshape(1, -1),
-                        embeddings[ID].reshape(1, -1),
-                    )
-                )
-        # distances = {ID: d / len(self.papers) for ID, d in distances.items()}
-        distances = {ID: np.median(d) for ID, d in distances.items()}
-
-        # sort and truncate
-        self.results.fill(self.papers, N=len(distances), ignore_authors=True)
-        scores = self.results.suggestions.set_score(distances.values())
-        self.results.suggestions.truncate(self.N)
+        distances = self.score(embeddings, model=model)
+
+        # select the best papers
+        best = top_n(distances, self.N)
+        self.results.fill(
+            self.store.frame(best), N=self.N, ignore_authors=True
+        )
+        scores = self.results.suggestions.set_score(distances[best])
 
         logger.debug(f"Recomended papers scores: {scores}")
 
+    def score(self, embeddings, model=None):
+        """
+            Scores all preprints against the user papers. When a saved TF-IDF
+            model is used and scores are cached, only preprints whose abstract
+            was not already scored for the same library and model version are
+            scored, the others re-use their cached score. Scores are cached by
+            abstract rather than by ID, as new versions of a preprint
+            can keep its ID (e.g. biorxiv's DOIs) with a revised abstract.
+
+            Arguments:
+                embeddings: TfidfVectors with preprints and user papers vectors
+                model: TfidfModel. Optional, the model that created the vectors
+
+            Returns:
+                scores: np.ndarray with one score per preprint
+        """
+        IDs = self.store.ids
+        user_vectors = embeddings.rows(self.user_abstracts.keys())
+
+        def compute(IDs):
+            return compute_similarity(
+                embeddings.rows(IDs),
+                user_vectors,
+                aggregation=self.aggregation,
+                top_k=self.top_k,
+            )
+
+        # a new model is fitted at each run without a saved model
+        if self.scores_cache is None or model is None:
+            return compute(IDs)
+
+        library = text_hash(
+            "\n".join(
+                [
+                    self.aggregation,
+                    str(self.top_k),
+                    *sorted(self.user_abstracts.values()),
+                ]
+            )
+        )
+        version = f"{model.fitted_at.isoformat()}/{model.version}"
+
+        abstracts = np.array([text_hash(a) for a in self.abstracts.values()])
+        cached = self.scores_cache.get(library, version, abstracts)
+        scores = np.array([cached.get(h, np.nan) for h in abstracts])
+        new = np.isnan(scores)
+        if new.any():
+            scores[new] = compute(IDs[new])
+            self.scores_cache.put(
+                library, version, dict(zip(abstracts[new], scores[new]))
+            )
+
+        logger.debug(
+            f"Scored {new.sum()} new preprints, {len(cached)} scores from cache"
+        )
+        return scores
+
+    def top_authors(self, N=10):
+        """
+            Returns the authors with most preprints among
+            all downloaded preprints
+
+            Arguments:
+                N: int. Number of authors to return
+
+            Returns:
+                authors: list of str of authors names
+        """
+        return top_authors(self.authors_table, N=N)
+
     def get_keywords(self, papers):
         """
             Extracts set of keywords that best represent the user papers.
@@ -177,15 +321,15 @@ class Recomender(Results):
             Arguments:
                 papers: pd.DataFrame with papers metadata
         """
-        keywords = {}
-        for n, (idx, user_paper) in enumerate(papers.iterrows()):
-            kwds = get_keywords_from_text(user_paper.abstract, N=10)
-
-            for m, kw in enumerate(kwds):
-                if kw in keywords.keys():
-                    keywords[kw] += 10 - m
-                else:
-                    keywords[kw] = 1
-
-        # sort keywords
-        self.results.keywords = Keywords(keywords)
+        start = perf_counter()
+        if self.keywords_backend == "tfidf":
+            self.results.keywords = get_tfidf_keywords(
+                self.embeddings, papers["id"]
+            )
+        else:
+            self.results.keywords = get_library_keywords(
+                papers, n_workers=self.n_workers, cache=self.keywords_cache
+            )
+        logger.debug(
+            f"Extracted keywords with {self.keywords_backend} backend in {perf_counter() - start:.3f}s"
+        )
@@ -5,8 +5,6 @@ from loguru import logger
 
 from rich.terminal_theme import TerminalTheme
 
-
-from pyinspect.panels import Report
 from myterial import orange, salmon, orange_dark
 
 sys.path.append("./")
@@ -87,6 +85,8 @@ class Results:
             Returns:
                 summary: pyinspect.Report with content
         """
+        from pyinspect.panels import Report  # slow to import
+
         # try to get an highlighter
         try:
             highlighter = self.keywords.get_highlighter()
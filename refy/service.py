@@ -0,0 +1,288 @@
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+from loguru import logger
+
+from refy.download import fetch_preprints
+from refy.cache import PreprintsCache, LibraryCache
+from refy.input import load_user_input, loaders
+from refy.infer import TfidfModel
+from refy.store import PaperStore
+from refy.similarity import compute_similarity, top_n
+
+# valid names for libraries stored in the libraries folder
+library_name = re.compile(r"^[\w\-]+$")
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+        Handles HTTP requests sent to a Service:
+            GET /status: info about the preprints corpus
+            GET /suggest?library=NAME&N=10: suggestions for a library saved
+                as NAME.bib in the service's libraries folder
+            POST /suggest?N=10: suggestions for a .bib file sent as the
+                request's body
+    """
+
+    service = None
+
+    def _respond(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, suggest):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        try:
+            if url.path == "/status":
+                self._respond(200, self.service.status())
+            elif url.path == "/suggest":
+                N = int(query["N"][0]) if "N" in query else None
+                self._respond(200, suggest(query, N))
+            else:
+                self._respond(404, dict(error=f"Unknown path: {url.path}"))
+        except FileNotFoundError as e:
+            self._respond(404, dict(error=str(e)))
+        except (ValueError, KeyError) as e:
+            self._respond(400, dict(error=str(e)))
+        except RuntimeError as e:
+            self._respond(503, dict(error=str(e)))
+        except Exception as e:
+            logger.exception(f"Failed to handle request: {self.path}")
+            self._respond(500, dict(error=f"Internal error: {e}"))
+
+    def do_GET(self):
+        def suggest(query, N):
+            if "library" not in query:
+                raise ValueError("Missing 'library' parameter")
+            return self.service.suggest_library(query["library"][0], N=N)
+
+        self._handle(suggest)
+
+    def do_POST(self):
+        def suggest(query, N):
+            length = int(self.headers.get("Content-Length", 0))
+            bib = self.rfile.read(length).decode("utf-8")
+            return self.service.suggest_bib(bib, N=N)
+
+        self._handle(suggest)
+
+    def log_message(self, format, *args):
+        logger.debug("refy service | " + format % args)
+
+
+class Service:
+    def __init__(
+        self,
+        libraries_folder=None,
+        n_days=7,
+        N=10,
+        refresh_every=6,
+        aggregation="median",
+        top_k=5,
+        use_cache=True,
+        cache_path=None,
+    ):
+        """
+            Long running recommendation service. It keeps the preprints
+            corpus, a TF-IDF model and the preprints' vectors in memory and
+            refreshes them on a schedule, so that suggestions for a user
+            library only need the user papers to be vectorized and scored.
+            Suggestions are served as JSON over a local HTTP endpoint.
+
+            Arguments:
+                libraries_folder: str, Path. Optional folder with .bib files
+                    that can be requested by name (without suffix)
+                n_days: int. Number of days from preprints are to be taken
+                N: int. Default number of papers to return
+                refresh_every: float. Hours between corpus refreshes
+                aggregation: str. How the similarity of a preprint to each user
+                    paper is combined into its score (see refy.similarity)
+                top_k: int. Number of user papers used by 'top_k_mean'
+                use_cache: bool. If true preprints and parsed libraries
+                    are cached on disk
+                cache_path: str, Path. Optional path to the cache's .db file
+        """
+        self.libraries_folder = (
+            Path(libraries_folder) if libraries_folder else None
+        )
+        self.n_days = n_days
+        self.N = N
+        self.refresh_every = refresh_every
+        self.aggregation = aggregation
+        self.top_k = top_k
+
+        self.cache = PreprintsCache(cache_path) if use_cache else None
+        self.library_cache = LibraryCache(cache_path) if use_cache else None
+
+        self.corpus = None  # paper store, model and vectors
+        self.refreshed_at = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # ---------------------------------- corpus ---------------------------------- #
+    def refresh(self):
+        """
+            Downloads the latest preprints, fits a new TF-IDF model and
+            vectorizes all preprints. The new corpus replaces the
+            previous one only once it's complete.
+        """
+        with self._refresh_lock:
+            logger.debug("Refreshing refy service corpus")
+            papers = PaperStore(*fetch_preprints(self.n_days, cache=self.cache))
+            texts = papers.abstracts.values()
+
+            # the model is frozen so user papers don't change it
+            model = TfidfModel(update_idf=False)
+            model.fit(texts)
+            vectors = model.transform(texts)
+
+            self.corpus = (papers, model, vectors)
+            self.refreshed_at = datetime.now()
+            logger.debug(f"Refreshed corpus: {len(papers)} preprints")
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_every * 3600):
+            try:
+                self.refresh()
+            except Exception as e:  # keep serving the previous corpus
+                logger.warning(f"Failed to refresh refy service corpus: {e}")
+
+    def status(self):
+        """
+            Returns a dict with info about the preprints corpus
+        """
+        if self.corpus is None:
+            return dict(ready=False)
+
+        papers, model, vectors = self.corpus
+        return dict(
+            ready=True,
+            n_preprints=len(papers),
+            n_terms=vectors.shape[1],
+            n_days=self.n_days,
+            refreshed_at=self.refreshed_at.isoformat(),
+        )
+
+    # -------------------------------- suggestions ------------------------------- #
+    def suggest(self, user_papers, N=None):
+        """
+            Scores all preprints against a user library and returns the best
+
+            Arguments:
+                user_papers: pd.DataFrame with user papers (see refy.input)
+                N: int. Number of papers to return
+
+            Returns:
+                suggestions: list of dict with papers metadata and score
+        """
+        if self.corpus is None:
+            raise RuntimeError("The preprints corpus is not loaded yet")
+        if user_papers.empty:
+            raise ValueError("No paper with an abstract in the user library")
+
+        papers, model, vectors = self.corpus
+        scores = compute_similarity(
+            vectors,
+            model.transform(list(user_papers.abstract)),
+            aggregation=self.aggregation,
+            top_k=self.top_k,
+        )
+
+        best = top_n(scores, N or self.N)
+        suggestions = papers.frame(best)
+        suggestions["score"] = scores[best]
+        return json.loads(suggestions.to_json(orient="records"))
+
+    def suggest_bib(self, bib, N=None):
+        """
+            Returns suggestions for a user library. Uploaded
+            libraries are parsed without the library cache, as they're
+            usually sent once and would only fill it up.
+
+            Arguments:
+                bib: str. Content of a .bib file
+                N: int. Number of papers to return
+        """
+        handle, path = tempfile.mkstemp(suffix=".bib")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as fl:
+                fl.write(bib)
+            user_papers = load_user_input(path)
+        finally:
+            os.remove(path)
+        return self.suggest(user_papers, N=N)
+
+    def suggest_library(self, library, N=None):
+        """
+            Returns suggestions for a library in the libraries folder
+
+            Arguments:
+                library: str. Name of the library's file, without suffix
+                N: int. Number of papers to return
+        """
+        if self.libraries_folder is None:
+            raise FileNotFoundError("The service has no libraries folder")
+        if not library_name.match(library):
+            raise ValueError(f"Invalid library name: {library}")
+
+        paths = [
+            self.libraries_folder / f"{library}{suffix}" for suffix in loaders
+        ]
+        paths = [path for path in paths if path.exists()]
+        if not paths:
+            raise FileNotFoundError(f"Library not found: {library}")
+
+        user_papers = load_user_input(paths[0], cache=self.library_cache)
+        return self.suggest(user_papers, N=N)
+
+    # ---------------------------------- serving --------------------------------- #
+    def make_server(self, host="127.0.0.1", port=8000):
+        """
+            Creates the HTTP server for the service, without
+            loading the corpus or starting to serve requests
+
+            Arguments:
+                host: str. Address to listen on
+                port: int. Port to listen on (0 picks a free port)
+        """
+        handler = type("Handler", (_Handler,), dict(service=self))
+        return _ThreadingServer((host, port), handler)
+
+    def serve(self, host="127.0.0.1", port=8000):
+        """
+            Loads the preprints corpus, starts refreshing it on a schedule
+            and serves requests until interrupted
+
+            Arguments:
+                host: str. Address to listen on
+                port: int. Port to listen on
+        """
+        self.refresh()
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+
+        server = self.make_server(host=host, port=port)
+        logger.info(f"refy service listening on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            server.server_close()
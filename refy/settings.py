@@ -1,3 +1,5 @@
+from pathlib import Path
+
 arxiv_categories = [
     # computer science
     "cs.AI",  # artificial inteligence
@@ -26,3 +28,6 @@ biorxiv_categories = (
     "deep learning",
     "robotics",
 )
+
+# folder where refy stores cached data (e.g. downloaded preprints)
+cache_folder = Path.home() / ".refy"
@@ -0,0 +1,183 @@
+import numpy as np
+from scipy import sparse
+from loguru import logger
+
+# ways of aggregating the similarity of a preprint to all user papers
+aggregations = ("median", "mean", "max", "top_k_mean")
+
+# max number of similarity values held in a dense block at once
+max_block_size = 2 ** 22
+
+
+def _as_sparse(vectors):
+    """
+        Makes sure that a set of vectors is a CSR sparse matrix
+
+        Arguments:
+            vectors: np.ndarray or scipy.sparse matrix with one vector per row
+
+        Returns:
+            vectors: scipy.sparse.csr_matrix
+    """
+    if sparse.issparse(vectors):
+        return vectors.tocsr()
+    else:
+        return sparse.csr_matrix(np.atleast_2d(vectors))
+
+
+def aggregate(similarity, aggregation="median", top_k=5):
+    """
+        Aggregates a dense (n preprints x n user papers) similarity
+        matrix into one score per preprint
+
+        Arguments:
+            similarity: np.ndarray with similarity values
+            aggregation: str. One of 'median', 'mean', 'max', 'top_k_mean'
+            top_k: int. Number of most similar user papers averaged
+                when aggregation is 'top_k_mean'
+
+        Returns:
+            scores: np.ndarray with one score per row
+    """
+    if aggregation == "median":
+        return np.median(similarity, axis=1)
+    elif aggregation == "mean":
+        return similarity.mean(axis=1)
+    elif aggregation == "max":
+        return similarity.max(axis=1)
+    elif aggregation == "top_k_mean":
+        k = max(1, min(int(top_k), similarity.shape[1]))
+        top = np.partition(similarity, similarity.shape[1] - k, axis=1)
+        return top[:, -k:].mean(axis=1)
+    else:
+        raise ValueError(
+            f"Invalid aggregation: {aggregation}, "
+            f"should be one of: {aggregations}"
+        )
+
+
+def top_n(scores, N):
+    """
+        Returns the indices of the N largest scores, from largest to smallest,
+        with a partial sort: only the selected scores are sorted.
+        NaN scores are ranked last.
+
+        Arguments:
+            scores: np.ndarray with one score per item
+            N: int. Number of items to select
+
+        Returns:
+            best: np.ndarray of int with the indices of the selected items
+    """
+    scores = np.nan_to_num(np.asarray(scores, dtype=float), nan=-np.inf)
+    N = max(0, min(int(N), len(scores)))
+    if N == 0:
+        return np.array([], dtype=int)
+
+    best = np.argpartition(-scores, N - 1)[:N]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def compute_similarity(
+    preprint_vectors,
+    user_vectors,
+    aggregation="median",
+    top_k=5,
+    chunk_size=2048,
+):
+    """
+        Computes the cosine similarity between every preprint and every
+        user paper with batched sparse matrix products and aggregates it
+        across user papers to get a single score per preprint.
+
+        Arguments:
+            preprint_vectors: np.ndarray or sparse matrix, one row per preprint
+            user_vectors: np.ndarray or sparse matrix, one row per user paper
+            aggregation: str. How to combine the similarity to each user
+                paper, one of 'median', 'mean', 'max', 'top_k_mean'
+            top_k: int. Number of user papers used by 'top_k_mean'
+            chunk_size: int. Number of preprints scored in each product,
+                limits the size of the dense similarity block
+
+        Returns:
+            scores: np.ndarray with one score per preprint
+    """
+    n_users = _as_sparse(user_vectors).shape[0]
+    return compute_group_similarity(
+        preprint_vectors,
+        user_vectors,
+        [0, n_users],
+        aggregation=aggregation,
+        top_k=top_k,
+        chunk_size=chunk_size,
+    )[:, 0]
+
+
+def compute_group_similarity(
+    preprint_vectors,
+    user_vectors,
+    offsets,
+    aggregation="median",
+    top_k=5,
+    chunk_size=2048,
+):
+    """
+        Like compute_similarity, but the user papers are split into groups
+        (e.g. the libraries of different users) that are all scored in
+        the same matrix products, returning one score per preprint and group.
+
+        Arguments:
+            preprint_vectors: np.ndarray or sparse matrix, one row per preprint
+            user_vectors: np.ndarray or sparse matrix, one row per user paper.
+                Papers in the same group must be in consecutive rows.
+            offsets: list of int. Group n is made of the user papers
+                in rows offsets[n] to offsets[n+1]
+            aggregation: str. How to combine the similarity to each user
+                paper, one of 'median', 'mean', 'max', 'top_k_mean'
+            top_k: int. Number of user papers used by 'top_k_mean'
+            chunk_size: int. Max number of preprints scored in each product
+
+        Returns:
+            scores: np.ndarray of shape n preprints x n groups
+    """
+    if aggregation not in aggregations:
+        raise ValueError(
+            f"Invalid aggregation: {aggregation}, "
+            f"should be one of: {aggregations}"
+        )
+
+    from sklearn.preprocessing import normalize  # slow to import
+
+    preprints = _as_sparse(preprint_vectors)
+    users = normalize(_as_sparse(user_vectors)).T.tocsc()
+    n_preprints, n_users = preprints.shape[0], users.shape[1]
+    n_groups = len(offsets) - 1
+    logger.debug(
+        f"Computing similarity of {n_preprints} preprints to "
+        f"{n_users} user papers in {n_groups} groups | aggregation: {aggregation}"
+    )
+
+    scores = np.zeros((n_preprints, n_groups))
+    if not n_preprints or not n_users:
+        return scores
+
+    # keep the dense similarity block small with many user papers
+    chunk_size = max(1, min(chunk_size, max_block_size // n_users))
+    for start in range(0, n_preprints, chunk_size):
+        end = min(start + chunk_size, n_preprints)
+        # normalizing each chunk avoids copying all preprint
+        # vectors, which may be memory-mapped
+        chunk = normalize(preprints[start:end])
+        similarity = (chunk @ users).toarray()
+
+        for group in range(n_groups):
+            first, last = offsets[group], offsets[group + 1]
+            if first == last:
+                continue
+            scores[start:end, group] = aggregate(
+                similarity[:, first:last],
+                aggregation=aggregation,
+                top_k=top_k,
+            )
+
+    return scores
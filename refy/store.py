@@ -0,0 +1,199 @@
+import sys
+from itertools import chain
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+
+def _intern(values):
+    """
+        Stores a column of strings as an object array of interned
+        strings, so that repeated values share the same object.
+        Missing values are stored as None
+    """
+    return np.array(
+        [sys.intern(v) if isinstance(v, str) else None for v in values],
+        dtype=object,
+    )
+
+
+class AbstractsView(Mapping):
+    def __init__(self, store):
+        """
+            Read only dict-like view of the abstracts in a PaperStore,
+            mapping each paper's ID to its abstract.
+
+            Arguments:
+                store: PaperStore
+        """
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store.ids)
+
+    def __getitem__(self, ID):
+        return self.store.abstract(self.store.index[ID])
+
+    def values(self):
+        return [self.store.abstract(n) for n in range(len(self.store))]
+
+
+class PaperStore:
+    def __init__(self, papers, abstracts):
+        """
+            Compact storage for the metadata and abstracts of many papers.
+            Text columns are stored as interned strings, source and category
+            as categoricals, years as integers, authors as integer codes with
+            offsets marking where each paper's authors start, and all abstracts
+            in a single utf-8 buffer with offsets.
+            Dataframes for (a subset of) the papers are created when needed.
+
+            Arguments:
+                papers: pd.DataFrame with papers metadata, with
+                    authors as lists of names (see refy.download.clean_preprints)
+                abstracts: dict of ID: abstract
+        """
+        papers = papers.reset_index(drop=True)
+
+        # metadata
+        self.ids = _intern(papers["id"])
+        self.doi = _intern(papers["doi"])
+        self.title = _intern(papers["title"])
+        self.url = _intern(papers["url"])
+        self.source = pd.Categorical(papers["source"])
+        self.category = pd.Categorical(papers["category"])
+        self.year = (
+            pd.to_numeric(papers["year"], errors="coerce")
+            .fillna(0)
+            .astype(np.int16)
+            .values
+        )
+        self.index = {ID: n for n, ID in enumerate(self.ids)}
+
+        # authors
+        authors = [a if isinstance(a, list) else [] for a in papers.authors]
+        self.author_offsets = np.concatenate(
+            [[0], np.cumsum([len(a) for a in authors])]
+        ).astype(np.int64)
+        names = pd.Categorical(list(chain.from_iterable(authors)))
+        self.author_codes = names.codes.astype(np.int32)
+        self.author_names = np.asarray(names.categories, dtype=object)
+
+        # abstracts
+        encoded = [
+            abstracts[ID].encode("utf-8")
+            if isinstance(abstracts.get(ID), str)
+            else b""
+            for ID in self.ids
+        ]
+        self.abstract_offsets = np.concatenate(
+            [[0], np.cumsum([len(a) for a in encoded])]
+        ).astype(np.int64)
+        self.abstracts_buffer = b"".join(encoded)
+        self.abstracts = AbstractsView(self)
+
+        logger.debug(
+            f"Stored {len(self)} papers in {self.memory_usage() / 1e6:.1f} MB"
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def abstract(self, n):
+        """
+            Returns the abstract of the n-th paper
+        """
+        start, end = self.abstract_offsets[n], self.abstract_offsets[n + 1]
+        return self.abstracts_buffer[start:end].decode("utf-8")
+
+    def authors(self, n):
+        """
+            Returns the list of authors of the n-th paper
+        """
+        start, end = self.author_offsets[n], self.author_offsets[n + 1]
+        return self.author_names[self.author_codes[start:end]].tolist()
+
+    def frame(self, rows=None):
+        """
+            Creates a dataframe with the metadata of a set of papers
+
+            Arguments:
+                rows: list of int. Optional indices of the papers to
+                    include, all papers by default
+
+            Returns:
+                papers: pd.DataFrame with papers metadata
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        return pd.DataFrame(
+            dict(
+                id=self.ids[rows],
+                doi=self.doi[rows],
+                title=self.title[rows],
+                authors=[self.authors(n) for n in rows],
+                category=self.category[rows],
+                source=self.source[rows],
+                url=self.url[rows],
+                year=self.year[rows],
+            )
+        )
+
+    def authors_table(self):
+        """
+            Creates a table with one row for each author of each paper,
+            (see refy.authors.authors_table) directly from the author codes
+
+            Returns:
+                table: pd.DataFrame with 'id', 'position' and 'author' columns
+        """
+        n_authors = np.diff(self.author_offsets)
+        position = np.arange(len(self.author_codes)) - np.repeat(
+            self.author_offsets[:-1], n_authors
+        )
+        return pd.DataFrame(
+            dict(
+                id=np.repeat(self.ids, n_authors),
+                position=position,
+                author=pd.Categorical.from_codes(
+                    self.author_codes, categories=self.author_names
+                ),
+            )
+        )
+
+    def memory_usage(self):
+        """
+            Returns the approximate memory used by the store, in bytes
+        """
+        strings = {
+            id(value): sys.getsizeof(value)
+            for column in (self.ids, self.doi, self.title, self.url)
+            for value in column
+            if value is not None
+        }
+        strings.update(
+            {id(name): sys.getsizeof(name) for name in self.author_names}
+        )
+
+        arrays = (
+            self.ids,
+            self.doi,
+            self.title,
+            self.url,
+            self.year,
+            self.author_offsets,
+            self.author_codes,
+            self.author_names,
+            self.abstract_offsets,
+            self.source.codes,
+            self.category.codes,
+        )
+        return (
+            sum(strings.values())
+            + sum(array.nbytes for array in arrays)
+            + sys.getsizeof(self.index)
+            + len(self.abstracts_buffer)
+        )
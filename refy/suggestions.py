@@ -2,12 +2,16 @@ from rich.table import Table
 from rich.console import Console
 from io import StringIO
 from rich import print
-import pandas as pd
 from loguru import logger
 
 from myterial import orange, amber, pink, light_green, blue_grey_lighter
 
-from refy.authors import get_authors
+from refy.authors import (
+    get_authors,
+    normalize_authors,
+    authors_table,
+    top_authors,
+)
 
 
 class Suggestions:
@@ -125,21 +129,10 @@ class Suggestions:
             Returns:
                 authors: list of str of authors names
         """
-        # Get how often authors show up
-        authors = {}
-        for i, paper in self.suggestions.iterrows():
-            for author in get_authors(paper):
-                if author in authors.keys():
-                    authors[author] += 1
-                else:
-                    authors[author] = 1
-
-        # sort authors
-        authors = pd.Series(authors)
-        if authors.empty:
-            self.authors = []
-        else:
-            self.authors = list(pd.Series(authors).sort_values().index)[::-1]
+        papers = self.suggestions.assign(
+            authors=normalize_authors(self.suggestions)
+        )
+        self.authors = top_authors(authors_table(papers))
         return self.authors
 
     def to_table(self, title=None, highlighter=None):
@@ -1,5 +1,6 @@
 import subprocess
 import os
+import hashlib
 from loguru import logger
 from datetime import datetime
 
@@ -12,6 +13,20 @@ def date_to_string(date):
     return date.strftime("%Y-%m-%d")
 
 
+def text_hash(text):
+    """
+        Returns a hash of a string's content, used to
+        recognize texts that have been seen before
+
+        Arguments:
+            text: str
+
+        Returns:
+            hash: str with hex digest
+    """
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()
+
+
 def open_in_browser(url):
     """
         Open an url or .html file in default web browser
@@ -1,4 +1,6 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 def check_internet_connection(
@@ -55,3 +57,75 @@ def request(url, to_json=False):
         return response.content.decode("utf-8")
     else:
         return response.json()
+
+
+class Session:
+    def __init__(
+        self, n_connections=8, retries=3, backoff=0.5, check_connection=True
+    ):
+        """
+            A pooled HTTP session that re-uses connections across requests,
+            retries failed requests with exponential backoff and checks
+            for an internet connection at most once.
+
+            Arguments:
+                n_connections: int. Max number of pooled connections per host
+                retries: int. Number of times a failed request is retried
+                backoff: float. Backoff factor (in seconds) between retries
+                check_connection: bool. If false the internet connection
+                    is never checked
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=n_connections,
+            pool_maxsize=n_connections,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=(429, 500, 502, 503, 504),
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.connected = not check_connection
+
+    def check_connection(self):
+        """
+            Checks the internet connection the first time it's called
+        """
+        if not self.connected:
+            self.connected = check_internet_connection()
+
+    def request(self, url, to_json=False):
+        """
+            Sends a request to an url and
+            makes sure it worked
+        """
+        self.check_connection()
+
+        response = self.session.get(url)
+        if not response.ok:
+            raise ValueError(
+                f"Failed to get a good response when retrieving from {url}. Response: {response.status_code}"
+            )
+        if not to_json:
+            return response.content.decode("utf-8")
+        else:
+            return response.json()
+
+    def stream(self, url, chunk_size=2 ** 16):
+        """
+            Sends a request to an url and yields the
+            response's content in chunks as they arrive
+        """
+        self.check_connection()
+
+        with self.session.get(url, stream=True) as response:
+            if not response.ok:
+                raise ValueError(
+                    f"Failed to get a good response when retrieving from {url}. Response: {response.status_code}"
+                )
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield chunk
@@ -12,10 +12,10 @@ requirements = [
     "requests",
     "myterial",
     "rich",
-    "bibtexparser",
-    "xmltodict",
     "sklearn",
+    "scipy",
     "gensim==3.8.3",
+    "typer",
 ]
 
 setup(
@@ -30,7 +30,6 @@ setup(
         "Operating System :: Microsoft :: Windows :: Windows 10",
         "Operating System :: MacOS :: MacOS X",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Intended Audience :: Developers",
@@ -40,8 +39,8 @@ setup(
     extras_require={
         "dev": ["pytest", "pytest-sugar", "pytest-cov", "coverage"]
     },
-    python_requires=">3.6",
-    packages=find_namespace_packages(exclude=("tests, examples")),
+    python_requires=">=3.7",
+    packages=find_namespace_packages(exclude=("tests, examples", "benchmarks*")),
     entry_points={"console_scripts": ["refy = refy.cli:app"]},
     include_package_data=True,
     url="https://github.com/FedeClaudi/refy",
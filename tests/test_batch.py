@@ -0,0 +1,11 @@
+import pytest
+
+from refy.batch import batch_recommend
+
+
+def test_duplicate_users(tmp_path):
+    for name in ("alice.bib", "alice.ris", "bob.bib"):
+        (tmp_path / name).write_text("")
+
+    with pytest.raises(ValueError, match="alice"):
+        batch_recommend(tmp_path, tmp_path / "output")
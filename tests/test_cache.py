@@ -0,0 +1,109 @@
+import pandas as pd
+
+import refy.download
+from refy.cache import PreprintsCache
+from refy.download import IncompleteDownloadError, fetch_preprints
+
+
+class Archive:
+    def __init__(self):
+        """
+            A stand-in for a preprints database, papers
+            are added to it as they are announced
+        """
+        self.papers = []
+        self.downloads = []
+
+    def add(self, day, n=1):
+        start = len(self.papers)
+        self.papers += [
+            dict(id=f"paper{start + i}", published=day, abstract="abstract")
+            for i in range(n)
+        ]
+
+    def download(self, today, start_date):
+        self.downloads.append((start_date, today))
+        papers = pd.DataFrame(self.papers, columns=["id", "published"])
+        return papers.loc[
+            (papers.published >= start_date) & (papers.published <= today)
+        ]
+
+
+def test_late_papers_are_not_missed(tmp_path):
+    cache = PreprintsCache(tmp_path / "cache.db")
+    archive = Archive()
+
+    # on monday, friday's papers are not announced yet
+    archive.add("2021-01-07")
+    papers = cache.fetch(
+        "arxiv", archive.download, "2021-01-11", "2021-01-05", "published"
+    )
+    assert list(papers.published) == ["2021-01-07"]
+
+    # they're announced on monday evening
+    archive.add("2021-01-08", n=2)
+    papers = cache.fetch(
+        "arxiv", archive.download, "2021-01-12", "2021-01-05", "published"
+    )
+    assert sorted(papers.published) == ["2021-01-07"] + ["2021-01-08"] * 2
+
+    # only days older than arxiv's finality window were stored
+    stored = cache.stored_days("arxiv", "2021-01-05", "2021-01-12")
+    assert sorted(stored) == ["2021-01-05", "2021-01-06", "2021-01-07"]
+
+
+def test_incomplete_download(tmp_path):
+    cache = PreprintsCache(tmp_path / "cache.db")
+    archive = Archive()
+    for day in ("2021-01-01", "2021-01-02", "2021-01-03", "2021-01-04"):
+        archive.add(day, n=3)
+
+    # arxiv stops returning papers in the middle of 2021-01-02
+    def download(today, start_date):
+        papers = archive.download(today, start_date).iloc[::-1][:7]
+        raise IncompleteDownloadError("rate limited", papers, "2021-01-02")
+
+    papers = cache.fetch(
+        "arxiv", download, "2021-01-20", "2021-01-01", "published"
+    )
+    assert len(papers) == 7
+
+    # only the days after the last downloaded day are stored
+    stored = cache.stored_days("arxiv", "2021-01-01", "2021-01-20")
+    assert min(stored) == "2021-01-03"
+    assert len(cache.load("arxiv", ["2021-01-03", "2021-01-04"])) == 6
+
+    # and the others are downloaded at the next run
+    papers = cache.fetch(
+        "arxiv", archive.download, "2021-01-20", "2021-01-01", "published"
+    )
+    assert len(papers) == 12
+    assert min(cache.stored_days("arxiv", "2021-01-01", "2021-01-20")) == (
+        "2021-01-01"
+    )
+
+
+def test_final_days_per_source(tmp_path):
+    cache = PreprintsCache(tmp_path / "cache.db", final_after=dict(arxiv=7))
+
+    assert cache.is_final("biorxiv", "2021-01-08", today="2021-01-10")
+    assert not cache.is_final("biorxiv", "2021-01-09", today="2021-01-10")
+    assert cache.is_final("arxiv", "2021-01-03", today="2021-01-10")
+    assert not cache.is_final("arxiv", "2021-01-08", today="2021-01-10")
+
+
+def test_no_preprints(tmp_path, monkeypatch):
+    # arxiv is rate limited and there are no biorxiv papers
+    def download_arxiv(today, start_date):
+        raise IncompleteDownloadError("rate limited", pd.DataFrame())
+
+    monkeypatch.setattr(refy.download, "download_arxiv", download_arxiv)
+    monkeypatch.setattr(
+        refy.download, "download_biorxiv", lambda today, start: pd.DataFrame()
+    )
+
+    papers, abstracts = fetch_preprints(
+        3, cache=PreprintsCache(tmp_path / "cache.db")
+    )
+    assert papers.empty
+    assert not abstracts
@@ -0,0 +1,222 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import refy.download
+import refy.web_utils
+from refy.download import (
+    IncompleteDownloadError,
+    download_arxiv,
+    download_biorxiv,
+)
+from refy.web_utils import Session
+
+today, start_date = "2021-01-10", "2021-01-05"
+
+
+def biorxiv_papers(n):
+    return [
+        dict(
+            doi=f"10.1101/{n}",
+            title=f"paper {n}",
+            authors="Doe, J.; Roe, R.",
+            date=today,
+            category="neuroscience",
+            abstract=f"abstract {n}",
+        )
+        for n in range(n)
+    ]
+
+
+def arxiv_feed(days):
+    """
+        Returns an arxiv Atom feed with one entry per publication day
+    """
+    entries = "".join(
+        "<entry>"
+        f"<id>http://arxiv.org/abs/2101.{n:05d}v1</id>"
+        f"<published>{day}T18:00:00Z</published>"
+        f"<title>paper {n}</title><summary>abstract {n}</summary>"
+        "<author><name>Jane Doe</name></author>"
+        "</entry>"
+        for n, day in enumerate(days)
+    )
+    return (
+        '<feed xmlns="http://www.w3.org/2005/Atom">' + entries + "</feed>"
+    ).encode("utf-8")
+
+
+class Server(ThreadingHTTPServer):
+    def __init__(self):
+        """
+            A local stand-in for the preprints APIs. Responses are
+            set in `routes` as path: list of (status, body), the last
+            response of each path is repeated. Requested paths
+            are stored in `requests`.
+        """
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.routes = {}
+        self.requests = []
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        responses = self.server.routes.get(self.path, [(404, b"")])
+        status, body = (
+            responses.pop(0) if len(responses) > 1 else responses[0]
+        )
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(
+        target=server.serve_forever, args=(0.01,), daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def connection_checks(monkeypatch):
+    checks = []
+    monkeypatch.setattr(
+        refy.web_utils,
+        "check_internet_connection",
+        lambda: checks.append(1) or True,
+    )
+    return checks
+
+
+def serve_biorxiv(server, papers, total=None):
+    total = len(papers) if total is None else total
+    for cursor in range(0, max(total, 1), 100):
+        page = dict(
+            messages=[dict(status="ok", cursor=cursor, total=total)],
+            collection=papers[cursor : cursor + 100],
+        )
+        server.routes[f"/biorxiv/{start_date}/{today}/{cursor}"] = [
+            (200, json.dumps(page).encode("utf-8"))
+        ]
+
+
+@pytest.fixture
+def arxiv(server, monkeypatch):
+    """
+        Serves pages of an arxiv feed, with one list
+        of publication days per page
+    """
+    monkeypatch.setattr(refy.download, "sleep", lambda seconds: None)
+    monkeypatch.setattr(refy.download, "arxiv_categories", ("q-bio.NC",))
+
+    def serve(pages):
+        for n, days in enumerate(pages):
+            server.routes[
+                "/query?search_query=cat:q-bio.NC&max_results=500"
+                f"&start={n * 500}&sortBy=submittedDate&sortOrder=descending"
+            ] = [(200, arxiv_feed(days))]
+        return server.url + "/query?search_query="
+
+    return serve
+
+
+# --------------------------------- biorxiv --------------------------------- #
+
+
+def test_biorxiv_pagination(server, connection_checks):
+    serve_biorxiv(server, biorxiv_papers(250))
+
+    papers = download_biorxiv(
+        today,
+        start_date,
+        session=Session(),
+        base_url=server.url + "/biorxiv/",
+    )
+    assert len(papers) == 250
+    assert list(papers.id) == [f"10.1101/{n}" for n in range(250)]
+    cursors = sorted(int(path.split("/")[-1]) for path in server.requests)
+    assert cursors == [0, 100, 200]
+
+    # the connection is checked once for all pages
+    assert len(connection_checks) == 1
+
+
+def test_biorxiv_incomplete(server):
+    # the API announces more papers than it returns
+    serve_biorxiv(server, biorxiv_papers(150), total=250)
+
+    with pytest.raises(IncompleteDownloadError) as error:
+        download_biorxiv(
+            today,
+            start_date,
+            session=Session(check_connection=False),
+            base_url=server.url + "/biorxiv/",
+        )
+    assert len(error.value.papers) == 150
+
+
+# ---------------------------------- arxiv ---------------------------------- #
+
+
+def test_arxiv_pagination(server, arxiv, connection_checks):
+    base_url = arxiv(
+        [["2021-01-09"] * 500, ["2021-01-06"] * 100 + ["2021-01-04"]]
+    )
+
+    papers = download_arxiv(
+        today, start_date, session=Session(), base_url=base_url
+    )
+    assert len(papers) == 600
+    assert len(server.requests) == 2
+    assert len(connection_checks) == 1
+
+
+def test_arxiv_incomplete(arxiv):
+    # arxiv returns an empty feed, e.g. when requests are rate limited
+    base_url = arxiv([["2021-01-09"] * 500, []])
+
+    with pytest.raises(IncompleteDownloadError) as error:
+        download_arxiv(
+            today,
+            start_date,
+            session=Session(check_connection=False),
+            base_url=base_url,
+        )
+    assert len(error.value.papers) == 500
+    assert error.value.complete_after == "2021-01-09"
+
+
+# --------------------------------- session --------------------------------- #
+
+
+def test_session_retries(server, connection_checks):
+    server.routes["/page"] = [(503, b""), (503, b""), (200, b"ok")]
+
+    session = Session(backoff=0)
+    assert session.request(server.url + "/page") == "ok"
+    assert session.request(server.url + "/page") == "ok"
+    assert len(server.requests) == 4
+    assert len(connection_checks) == 1
+
+
+def test_session_gives_up(server):
+    server.routes["/page"] = [(503, b"")]
+
+    session = Session(retries=2, backoff=0, check_connection=False)
+    with pytest.raises(ValueError, match="503"):
+        session.request(server.url + "/page")
+    assert len(server.requests) == 3
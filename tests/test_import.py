@@ -0,0 +1,36 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+root = Path(__file__).parent.parent
+
+# dependencies that should only be loaded by the stages that need them
+heavy = ("sklearn", "gensim", "pandas", "scipy")
+
+
+def loaded_modules(statement):
+    """
+        Runs a statement in a new interpreter and returns
+        the names of the modules imported by it
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys; {statement}; print(' '.join(sys.modules))",
+        ],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return set(output.split())
+
+
+@pytest.mark.parametrize("statement", ["import refy", "import refy.cli"])
+def test_import_is_lazy(statement):
+    modules = loaded_modules(statement)
+    assert "refy" in modules
+    assert not [module for module in modules if module.split(".")[0] in heavy]
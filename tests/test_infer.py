@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from refy.infer import TfidfModel, TfidfVectors, fit_tfidf
+
+preprints = {
+    f"paper{n}": text
+    for n, text in enumerate(
+        [
+            "spiking neural networks learn motor control in mice",
+            "a model of visual cortex dynamics during behaviour",
+            "robots learn to walk with reinforcement learning",
+            "memory consolidation in the hippocampus during sleep",
+        ]
+    )
+}
+library = {
+    "user0": "neural dynamics of motor cortex during learning",
+    "user1": "sleep and memory in mice",
+}
+
+
+@pytest.mark.parametrize(
+    "model", [None, TfidfModel(), TfidfModel(hashing=True, n_features=2 ** 12)]
+)
+def test_saved_vectors_transform(tmp_path, model):
+    fit_tfidf(preprints, library, model=model).save(tmp_path / "vectors")
+
+    # a worker vectorizes the library with the saved vectors only
+    vectors = TfidfVectors.load(tmp_path / "vectors")
+    user_vectors = vectors.transform(library.values())
+
+    expected = vectors.rows(library.keys()).toarray()
+    assert np.allclose(user_vectors.toarray(), expected)